@@ -0,0 +1,73 @@
+"""
+Minimal async client for an OpenAI-compatible chat completions endpoint.
+
+Classes:
+    AsyncChatClient: Keeps one pooled (HTTP/2 when available) httpx connection set
+                     open across requests, instead of a new session per call.
+"""
+
+from typing import Dict, List
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables httpx's HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Hugging Face's OpenAI-compatible inference router
+DEFAULT_BASE_URL = "https://router.huggingface.co/v1"
+
+
+class AsyncChatClient:
+    """
+    Chat completions over a shared `httpx.AsyncClient`.
+
+    With HTTP/2, concurrent requests are multiplexed over one connection per host;
+    otherwise they draw from a keep-alive pool. Idle connections are kept for
+    `keepalive_expiry` seconds so bursts after a quiet spell skip the TLS handshake.
+
+    Attributes:
+        model: Model id sent with every request
+    """
+
+    def __init__(self, model: str, token: str, base_url: str = DEFAULT_BASE_URL, timeout: float = 60,
+                 max_connections: int = 64, max_keepalive_connections: int = 32, keepalive_expiry: float = 120):
+        self.model = model
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=timeout,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+
+    async def chat_completion(self, messages: List[Dict[str, str]], **params) -> str:
+        """
+        Request a chat completion and return the generated message text.
+
+        Args:
+            messages: Chat messages as {"role": ..., "content": ...} dicts
+            **params: Extra request fields (max_tokens, temperature, ...)
+
+        Returns:
+            Content of the first choice's message
+
+        Raises:
+            httpx.HTTPStatusError: If the endpoint returns an error status
+        """
+        response = await self._client.post(
+            "/chat/completions",
+            json={"model": self.model, "messages": messages, **params}
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def aclose(self) -> None:
+        """Close all pooled connections."""
+        await self._client.aclose()
@@ -7,4 +7,41 @@ class Config:
     HF_TOKEN = os.getenv("HF_TOKEN")
     MODEL_NAME = os.getenv("MODEL_NAME", "meta-llama/Llama-3.3-70B-Instruct")
     EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-l6-v2")
-    VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "vectordb3/chroma")
\ No newline at end of file
+    # ONNX export of the embeddings model used for query embedding (empty to use PyTorch)
+    EMBEDDINGS_ONNX_FILE = os.getenv("EMBEDDINGS_ONNX_FILE", "onnx/model_O3.onnx")
+    # INT8 ONNX export used by the response-quality metrics encoder (empty to use PyTorch)
+    METRICS_ONNX_FILE = os.getenv("METRICS_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+    VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "vectordb3/chroma")
+    # Written into the vector database directory by data_processor.py on every ingest;
+    # caches of retrieved documents are keyed on it so a re-ingest invalidates them
+    INGEST_STAMP_FILE = "ingest_stamp"
+    # Distinct chunks whose embeddings data_processor.py keeps for reuse during an ingest (~1.5 KB each)
+    INGEST_EMBEDDING_CACHE_SIZE = int(os.getenv("INGEST_EMBEDDING_CACHE_SIZE", "20000"))
+    # Query-embedding similarity caches in front of retrieval and generation
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    # Validation verdicts only say whether a question is in scope, so a looser match is safe
+    VALIDATION_CACHE_THRESHOLD = float(os.getenv("VALIDATION_CACHE_THRESHOLD", "0.92"))
+    # Seconds a cached answer is served before it is generated afresh
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    # Set to DEBUG to see per-request pipeline details (intent, history, prompts)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    # Exact in-memory search (FAISS IndexFlatIP / NumPy) instead of Chroma's HNSW index
+    USE_FLAT_INDEX = os.getenv("USE_FLAT_INDEX", "false").lower() == "true"
+    # Seconds a generated batch of question suggestions is served from memory
+    SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", "3600"))
+    # Identical /api/chat and /api/summarize requests are answered from memory for this long (s)
+    EXACT_CACHE_SIZE = int(os.getenv("EXACT_CACHE_SIZE", "1024"))
+    EXACT_CACHE_TTL = int(os.getenv("EXACT_CACHE_TTL", "3600"))
+    # Connections kept open to the inference API, shared by all request threads
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    # Threads generating headings alongside request threads; match the server's request threads
+    LLM_IO_THREADS = int(os.getenv("LLM_IO_THREADS", os.getenv("GUNICORN_THREADS", "8")))
+    # Uploaded documents (OCR) longer than this many words are chunked into an in-memory vector
+    # store, and each turn sends only the chunks closest to the question; shorter ones are sent whole
+    DOCUMENT_INLINE_MAX_WORDS = int(os.getenv("DOCUMENT_INLINE_MAX_WORDS", "1000"))
+    # MiniLM reads at most 256 word pieces, so chunks stay around 200 tokens
+    DOCUMENT_CHUNK_WORDS = int(os.getenv("DOCUMENT_CHUNK_WORDS", "150"))
+    DOCUMENT_CHUNK_OVERLAP = int(os.getenv("DOCUMENT_CHUNK_OVERLAP", "25"))
+    DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "4"))
+    DOCUMENT_STORE_SIZE = int(os.getenv("DOCUMENT_STORE_SIZE", "256"))
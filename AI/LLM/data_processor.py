@@ -1,121 +1,235 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import CharacterTextSplitter
+# Size the OpenMP/MKL pools to every core; this has to happen before torch is imported
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count()))
+os.environ.setdefault("MKL_NUM_THREADS", str(os.cpu_count()))
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import queue
+from dataclasses import dataclass, field, replace
+import threading
+import time
+from typing import List
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import Chroma
-from langchain.schema import Document
+import chromadb
 import fitz
 from tqdm.auto import tqdm
-import re
-import requests
 
 from config import Config
 
 
+COLLECTION_NAME = "langchain"
+
 HUGGINGFACEHUB_API_TOKEN = Config.HF_TOKEN
 if HUGGINGFACEHUB_API_TOKEN is None:
     raise ValueError("HF_TOKEN not found in the .env file or the file path is incorrect")
 os.environ["HUGGINGFACEHUB_API_TOKEN"] = HUGGINGFACEHUB_API_TOKEN
 
-# Initialize the Hugging Face embeddings
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-l6-v2")
+
+class MiniLMEmbeddings(Embeddings):
+    """
+    LangChain embeddings for the MiniLM ingest job.
+
+    Runs FP16 PyTorch on CUDA when a GPU is available, otherwise the
+    INT8-quantized ONNX export on CPU.
+    """
+
+    def __init__(self, model_name: str = Config.EMBEDDINGS_MODEL,
+                 file_name: str = "onnx/model_qint8_avx512_vnni.onnx"):
+        if torch.cuda.is_available():
+            self.model = SentenceTransformer(model_name, device="cuda")
+            self.model.half()
+            self.batch_size = 256  # Larger batches keep the GPU busy
+        else:
+            self.model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": file_name})
+            self.batch_size = 64
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+            normalize_embeddings=True
+        ).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
 
 
 # Function to format text
 def text_formatter(text: str) -> str:
-    return re.sub(r'\s+', ' ', text).strip()
+    return ' '.join(text.split())
+
+@dataclass(slots=True)
+class Page:
+    """One non-empty PDF page and, once split, its chunks."""
+    page_number: int
+    text: str
+    pdf_path: str
+    chunks: list = field(default_factory=list)
+
+
+# Text extraction flags: keep page clipping, join words hyphenated across line breaks
+TEXT_FLAGS = fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_DEHYPHENATE | fitz.TEXT_MEDIABOX_CLIP
 
 # Function to open and read a PDF
 def open_and_read_pdf(pdf_path: str) -> list:
-    doc = fitz.open(pdf_path)
     medical_content = []
-    for page_number, page in tqdm(enumerate(doc), total=doc.page_count, desc=f"Reading {os.path.basename(pdf_path)}"):
-        text = page.get_text()
-        cleaned_text = text_formatter(text)
-        if cleaned_text:  # Skip empty pages
-            medical_content.append({
-                "page_number": page_number,
-                "page_char_count": len(cleaned_text),
-                "page_word_count": len(cleaned_text.split()),
-                "page_sentence_count_raw": len(cleaned_text.split('. ')),
-                "page_token_count": len(cleaned_text) // 4,
-                "text": cleaned_text
-            })
+    with fitz.open(pdf_path) as doc:
+        for page_number in range(doc.page_count):
+            text = doc.load_page(page_number).get_text("text", flags=TEXT_FLAGS)
+            cleaned_text = text_formatter(text)
+            if cleaned_text:  # Skip empty pages
+                medical_content.append(Page(page_number, cleaned_text, pdf_path))
     return medical_content
 
+# Slice text into fixed-size windows that overlap by `overlap` characters
+def slice_text(text: str, size: int = 1000, overlap: int = 100) -> list:
+    step = size - overlap
+    # Slice lazily and let filter(str.strip) drop blank windows in C
+    return list(filter(str.strip, (text[i:i + size] for i in range(0, len(text), step))))
+
 # Split text into chunks
 def split_text_into_chunks(medical_content):
-    text_splitter = CharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100,
-        length_function=len,
-        add_start_index=True
-    )
-    for item in medical_content:
-        chunks = text_splitter.split_text(item["text"])
-        item["chunks"] = [chunk for chunk in chunks if chunk.strip()]  # Skip empty chunks
+    # Page text is already whitespace-normalised, so plain slicing is enough
+    return [replace(page, chunks=slice_text(page.text)) for page in medical_content]
+
+# Read and chunk a single PDF (runs in a worker process)
+def read_and_split_pdf(pdf_path):
+    return split_text_into_chunks(open_and_read_pdf(pdf_path))
 
-# Function to split a list into smaller chunks
-def split_list(lst, chunk_size):
-    for i in range(0, len(lst), chunk_size):
-        yield lst[i:i + chunk_size]
+# Function to group an iterable into lists of at most batch_size items
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
 
-# Read all PDFs in a folder
+# Read all PDFs in a folder, one worker process per core, yielding (chunk_text, metadata) as PDFs finish
 def read_all_pdfs_in_folder(folder_path):
-    all_medical_content = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(folder_path, filename)
-            medical_content = open_and_read_pdf(pdf_path)
-            split_text_into_chunks(medical_content)
-            # Store pdf_path in medical_content for each item
-            for item in medical_content:
-                item['pdf_path'] = pdf_path  # Store the PDF path here
-            all_medical_content.extend(medical_content)
-    return all_medical_content
-
-# Main folder path containing the PDFs
-folder_path = '../main_dataset'
-medical_content = read_all_pdfs_in_folder(folder_path)
-
-# Create documents from the medical content
-documents = []
-for item in medical_content:
-    for chunk in item.get("chunks", []):
-        # Create the metadata dictionary
+    pdf_paths = [os.path.join(folder_path, filename) for filename in os.listdir(folder_path) if filename.endswith(".pdf")]
+    max_workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Keep only a few PDFs in flight so parsed text never piles up ahead of the embedder
+        pending = collections.deque()
+        with tqdm(total=len(pdf_paths), desc="Reading PDFs") as progress:
+            for pdf_path in pdf_paths:
+                pending.append(executor.submit(read_and_split_pdf, pdf_path))
+                if len(pending) >= 2 * max_workers:
+                    yield from _chunks_from(pending.popleft().result())
+                    progress.update()
+            while pending:
+                yield from _chunks_from(pending.popleft().result())
+                progress.update()
+
+# Flatten the medical content of one PDF into (chunk_text, metadata) pairs
+def _chunks_from(medical_content):
+    for page in medical_content:
+        # One metadata dict per page, shared by its chunks (Chroma does not mutate it)
         metadata = {
-            "source": os.path.basename(item.get("pdf_path", "Unknown")),  # Extract filename from path
-            "page_number": item.get("page_number", "Unknown")
+            "source": os.path.basename(page.pdf_path),  # Extract filename from path
+            "page_number": page.page_number
         }
-        documents.append(Document(page_content=chunk, metadata=metadata)) #Pass metadata
+        for chunk in page.chunks:
+            yield chunk, metadata
+
+# Embed texts, computing each distinct chunk once per batch and reusing recently seen chunks across
+# batches; emb_cache is an LRU OrderedDict kept to `capacity` entries so memory stays bounded
+def embed_with_cache(embeddings, texts, emb_cache, capacity):
+    hashes = [hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts]
+    vectors = {}
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h in vectors or h in missing:
+            continue
+        if h in emb_cache:
+            emb_cache.move_to_end(h)
+            vectors[h] = emb_cache[h]
+        else:
+            missing[h] = text
+    if missing:
+        computed = np.asarray(embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+        vectors.update(zip(missing.keys(), computed))
+        emb_cache.update(zip(missing.keys(), computed))
+        while len(emb_cache) > capacity:
+            emb_cache.popitem(last=False)
+    return [vectors[h].tolist() for h in hashes]
+
+# Write queued batches to Chroma; runs on its own thread so inserts overlap with embedding
+def chroma_writer(collection, batches):
+    while (batch := batches.get()) is not None:
+        i, ids, texts, metadatas, batch_embeddings = batch
+        try:
+            collection.add(ids=ids, documents=texts, metadatas=metadatas, embeddings=batch_embeddings)
+        except Exception as e:
+            print(f"Error adding batch {i+1}: {e}")
+
+
+if __name__ == "__main__":
+    # Torch defaults to fewer intra-op threads than cores in some setups; set it before the model loads
+    torch.set_num_threads(os.cpu_count())
+
+    # Initialize the embeddings (FP16 on CUDA, ONNX Runtime INT8 on CPU)
+    embeddings = MiniLMEmbeddings()
+
+    # Only one batch of chunks and embeddings is held in memory at a time
+    batch_size = 1000  # Stays under Chroma's SQLite max_batch_size
+
+    # Pre-create the collection with HNSW settings tuned for a bulk build: lower construction_ef and
+    # large insert/sync batches so the graph and its on-disk copy are updated far less often.
+    # The name stays LangChain's default, which is what SurgicalLLM opens.
+    db_path = '../vectordb3/chroma/'
+    client = chromadb.PersistentClient(path=db_path)
+    client.get_or_create_collection(
+        COLLECTION_NAME,
+        metadata={
+            "hnsw:construction_ef": 64,
+            "hnsw:M": 16,
+            "hnsw:batch_size": 10000,
+            "hnsw:sync_threshold": 50000
+        }
+    )
+    vectordb3 = Chroma(client=client, collection_name=COLLECTION_NAME, embedding_function=embeddings)
 
-# Split documents into smaller chunks to avoid payload size limit
-chunk_size = 10  # Adjust the chunk size if necessary
-document_chunks = list(split_list(documents, chunk_size))
+    # Boilerplate (headers, disclaimers, references) repeats across PDFs; recently embedded chunks are
+    # reused. Vectors are kept as float32 (~1.5 KB per chunk), for at most INGEST_EMBEDDING_CACHE_SIZE chunks.
+    emb_cache = collections.OrderedDict()
 
-# Initialize the vector database without the embeddings
-vectordb3 = None
+    # A few batches may wait for the writer; beyond that embedding blocks (backpressure)
+    batches = queue.Queue(maxsize=4)
+    writer = threading.Thread(target=chroma_writer, args=(vectordb3._collection, batches))
+    writer.start()
 
-# Process and add documents to the vector database
-for i, doc_chunk in enumerate(document_chunks):
-    print(f"Processing chunk {i+1}/{len(document_chunks)}...")
+    # Main folder path containing the PDFs
+    folder_path = '../main_dataset'
+    next_id = 0
     try:
-        # Create or add to the vector database
-        if vectordb3 is None:
-            vectordb3 = Chroma.from_documents(
-                documents=doc_chunk,
-                embedding=embeddings,
-                persist_directory='../vectordb3/chroma/'
-            )
-        else:
-            vectordb3.add_documents(doc_chunk)
-    except KeyError as e:
-        print(f"KeyError in chunk {i+1}: {e}. Skipping this chunk.")
-        continue
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON Decode Error in chunk {i+1}: {e}")
-        continue
-    except Exception as e:
-        print(f"Error processing chunk {i+1}: {e}")
-        continue
-
-print("Vector database creation complete.")
+        for i, chunks in enumerate(batched(read_all_pdfs_in_folder(folder_path), batch_size)):
+            # Sort by length so each embedding batch pads to a similar length; the ids keep the original (logical) order
+            order = sorted(range(len(chunks)), key=lambda j: len(chunks[j][0]))
+            document_ids = [f"{next_id + j:08d}" for j in order]
+            texts = [chunks[j][0] for j in order]
+            metadatas = [chunks[j][1] for j in order]
+            next_id += len(chunks)
+
+            try:
+                batch_embeddings = embed_with_cache(embeddings, texts, emb_cache, Config.INGEST_EMBEDDING_CACHE_SIZE)
+            except Exception as e:
+                print(f"Error embedding batch {i+1}: {e}")
+                continue
+            batches.put((i, document_ids, texts, metadatas, batch_embeddings))
+    finally:
+        batches.put(None)
+        writer.join()
+
+    # A new stamp per run changes the file names of SurgicalLLM's retrieval caches, so results
+    # cached against the previous collection are discarded on its next start
+    with open(os.path.join(db_path, Config.INGEST_STAMP_FILE), 'w') as f:
+        f.write(f"{time.time_ns()}\n")
+
+    print("Vector database creation complete.")
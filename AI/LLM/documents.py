@@ -0,0 +1,125 @@
+"""
+Retrieval over documents uploaded to a conversation (OCR text).
+
+Classes:
+    DocumentStore: Chunks and embeds each document once, then returns the chunks
+                   relevant to a question, so later turns don't resend the whole text.
+
+Functions:
+    document_context_message: System message carrying document text.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+
+import chromadb
+from langchain_chroma import Chroma
+
+_WORD_RE = re.compile(r"\S+")
+
+
+@lru_cache(maxsize=256)
+def document_context_message(text: str) -> dict:
+    """
+    System message carrying document text, with a consistent format instruction.
+
+    Cached so later turns of a conversation about the same document reuse the message.
+    """
+    return {
+        'role': 'system',
+        'content': f'Additional context from user\'s documents:\n\n{text}\n\nIMPORTANT: Respond in the same format as you would for a normal medical consultation. Use this information naturally but maintain your standard response structure.'
+    }
+
+
+def _chunk_words(text: str, chunk_words: int, overlap: int) -> List[str]:
+    """Split text into windows of `chunk_words` words overlapping by `overlap`, keeping the original spacing."""
+    spans = [m.span() for m in _WORD_RE.finditer(text)]
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_words]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_words >= len(spans):
+            break
+    return chunks
+
+
+class DocumentStore:
+    """
+    In-memory vector store for uploaded documents.
+
+    Documents are keyed by a digest of their text, so resending the same document on
+    every turn (or in another conversation) embeds it only once. Chunks live in an
+    ephemeral Chroma collection, never written to disk; the least recently used
+    documents are dropped beyond `capacity`.
+
+    Attributes:
+        capacity: Maximum number of documents kept
+    """
+
+    def __init__(self, embeddings, capacity: int = 256, chunk_words: int = 150, chunk_overlap: int = 25):
+        """
+        Args:
+            embeddings: Embeddings model used for the chunks (the query embeddings model)
+            capacity: Maximum number of documents kept
+            chunk_words: Words per chunk; kept within the embeddings model's input length
+            chunk_overlap: Words shared by consecutive chunks
+        """
+        self.capacity = capacity
+        self._chunk_words = chunk_words
+        self._chunk_overlap = chunk_overlap
+        self._vectordb = Chroma(
+            client=chromadb.EphemeralClient(),
+            collection_name="conversation_documents",
+            embedding_function=embeddings
+        )
+        # digest -> chunk ids, in least recently used order
+        self._documents: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def _ingest(self, text: str) -> str:
+        """Chunk and embed a document unless it is already stored; return its digest."""
+        digest = self._digest(text)
+        with self._lock:
+            if digest in self._documents:
+                self._documents.move_to_end(digest)
+                return digest
+
+            chunks = _chunk_words(text, self._chunk_words, self._chunk_overlap)
+            ids = [f"{digest}-{i}" for i in range(len(chunks))]
+            self._vectordb.add_texts(
+                chunks,
+                metadatas=[{"document": digest, "chunk": i} for i in range(len(chunks))],
+                ids=ids
+            )
+            self._documents[digest] = ids
+
+            while len(self._documents) > self.capacity:
+                _, evicted_ids = self._documents.popitem(last=False)
+                self._vectordb.delete(ids=evicted_ids)
+        return digest
+
+    def relevant_chunks(self, text: str, query_embedding: List[float], k: int = 4) -> List[str]:
+        """
+        Return the chunks of a document closest to a query, in document order.
+
+        Args:
+            text: Full document text; embedded on first sight
+            query_embedding: Embedding of the question
+            k: Number of chunks to return
+
+        Returns:
+            Up to k chunks of the document
+        """
+        digest = self._ingest(text)
+        docs = self._vectordb.similarity_search_by_vector(query_embedding, k=k, filter={"document": digest})
+        docs.sort(key=lambda doc: doc.metadata.get("chunk", 0))
+        return [doc.page_content for doc in docs]
@@ -0,0 +1,57 @@
+"""
+Rate-limited exception logging.
+
+Classes:
+    SampledExceptionLogger: Logs full tracebacks for the first few errors of each
+                            exception type per time window, one-line errors after that.
+"""
+
+import logging
+import threading
+import time
+
+
+class SampledExceptionLogger:
+    """
+    Exception logger that stops formatting tracebacks during error storms.
+
+    When the inference API rate-limits or times out, every request fails the same
+    way; formatting and writing the same stack for each one costs CPU and buries
+    the log. The first `limit` errors of a given exception type in each `window`
+    seconds are logged with their traceback, later ones as a single line.
+
+    Attributes:
+        limit: Tracebacks logged per exception type per window
+        window: Length of the counting window in seconds
+    """
+
+    def __init__(self, logger: logging.Logger, limit: int = 5, window: float = 60):
+        self.limit = limit
+        self.window = window
+        self._logger = logger
+        # exception type name -> (window start, errors seen in the window)
+        self._counts: "dict[str, tuple[float, int]]" = {}
+        self._lock = threading.Lock()
+
+    def exception(self, message: str, error: BaseException) -> None:
+        """
+        Log an error, with its traceback unless this type has hit its limit.
+
+        Args:
+            message: What failed, e.g. "Chat error"
+            error: The exception being handled
+        """
+        name = type(error).__name__
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._counts.get(name, (now, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            count += 1
+            self._counts[name] = (start, count)
+
+        if count <= self.limit:
+            self._logger.error("%s: %s", message, error, exc_info=error)
+        else:
+            self._logger.error("%s: %s (traceback suppressed, %d %s errors in %ds)",
+                               message, error, count, name, self.window)
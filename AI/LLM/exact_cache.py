@@ -0,0 +1,62 @@
+"""
+Exact-match cache for whole API responses.
+
+Classes:
+    ExactCache: Thread-safe LRU cache with a per-entry time-to-live, keyed by a
+                digest of the request fields that determine the response.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ExactCache:
+    """
+    LRU cache of values that expire `ttl` seconds after they were stored.
+
+    Keys are built with `ExactCache.key` from the request fields, so a hit means
+    the request was byte-for-byte identical (after canonical JSON encoding).
+
+    Attributes:
+        capacity: Maximum number of cached entries
+        ttl: Seconds an entry stays valid
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts) -> bytes:
+        """Return a 16-byte blake2b digest of the canonical JSON encoding of `parts`."""
+        canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[Any]:
+        """Return the value cached under `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: bytes, value: Any) -> None:
+        """Cache `value` under `key`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,117 @@
+"""
+Exact in-memory vector search over the Chroma collection.
+
+Classes:
+    FlatIndex: Brute-force inner-product index with MMR re-ranking, for corpora small
+               enough that an exact scan beats an HNSW graph walk.
+"""
+
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None
+    FAISS_AVAILABLE = False
+
+
+class FlatIndex:
+    """
+    Exact inner-product index over every vector stored in a Chroma collection.
+
+    Vectors are L2-normalized on load, so inner product equals cosine similarity.
+    Search uses a FAISS IndexFlatIP when faiss is installed, otherwise a single
+    NumPy matrix-vector product.
+
+    Attributes:
+        documents: Documents in index order
+        vectors: (N, D) float32 matrix of normalized embeddings
+    """
+
+    def __init__(self, collection, page_size: int = 5000):
+        """
+        Load all vectors and documents from the collection.
+
+        Args:
+            collection: Chroma collection (e.g. `Chroma._collection`)
+            page_size: Number of records fetched per `collection.get` call
+        """
+        self.documents: List[Document] = []
+        rows = []
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            rows.append(np.asarray(page["embeddings"], dtype=np.float32))
+            self.documents.extend(
+                Document(page_content=text or "", metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+            )
+
+        self.vectors = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.vectors /= np.maximum(norms, 1e-12)
+
+        self._faiss_index = None
+        if FAISS_AVAILABLE and len(self.vectors):
+            self._faiss_index = faiss.IndexFlatIP(self.vectors.shape[1])
+            self._faiss_index.add(self.vectors)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _top_k(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Return the indices of the k vectors most similar to the query, best first."""
+        k = min(k, len(self.documents))
+        if self._faiss_index is not None:
+            _, indices = self._faiss_index.search(query[None, :], k)
+            return indices[0]
+        scores = self.vectors @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 3, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5) -> List[Document]:
+        """
+        Return documents selected by maximal marginal relevance.
+
+        Takes the fetch_k nearest neighbours, then greedily picks k of them,
+        trading off similarity to the query against similarity to documents
+        already picked.
+
+        Args:
+            embedding: Query embedding
+            k: Number of documents to return
+            fetch_k: Number of nearest neighbours to re-rank
+            lambda_mult: 1 for pure relevance, 0 for maximum diversity
+
+        Returns:
+            List of selected documents
+        """
+        if not self.documents:
+            return []
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        candidates = self._top_k(query, fetch_k)
+        candidate_vectors = self.vectors[candidates]
+        relevance = candidate_vectors @ query
+        pairwise = candidate_vectors @ candidate_vectors.T
+
+        selected = [0]  # The nearest neighbour is always picked first
+        redundancy = pairwise[0].copy()
+        while len(selected) < min(k, len(candidates)):
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            scores[selected] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            np.maximum(redundancy, pairwise[best], out=redundancy)
+
+        return [self.documents[candidates[i]] for i in selected]
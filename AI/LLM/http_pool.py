@@ -0,0 +1,53 @@
+"""
+Process-wide HTTP connection pool for huggingface_hub.
+
+huggingface_hub creates one `requests.Session` per thread, and every session gets
+its own connection pool. The Flask dev server runs each request on a fresh
+thread, so every chat request paid a new TCP + TLS handshake to the inference
+API. `use_shared_connection_pool` keeps the per-thread sessions (requests.Session
+is not guaranteed to be thread-safe) but mounts one shared, thread-safe urllib3
+pool in all of them, so concurrent and successive requests reuse warm connections.
+
+Functions:
+    use_shared_connection_pool: Configure huggingface_hub to use the shared pool.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from huggingface_hub import configure_http_backend
+    CONFIGURE_HTTP_BACKEND_AVAILABLE = True
+except ImportError:
+    # huggingface_hub >= 1.0 uses a single shared httpx client instead of per-thread sessions
+    configure_http_backend = None
+    CONFIGURE_HTTP_BACKEND_AVAILABLE = False
+
+_adapter = None
+_lock = threading.Lock()
+
+
+def use_shared_connection_pool(pool_size: int = 32) -> None:
+    """
+    Make every huggingface_hub session share one connection pool. Safe to call more than once.
+
+    Args:
+        pool_size: Maximum number of connections kept open per host
+    """
+    global _adapter
+    if not CONFIGURE_HTTP_BACKEND_AVAILABLE:
+        return
+    with _lock:
+        if _adapter is not None:
+            return
+        _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+
+        def backend_factory() -> requests.Session:
+            session = requests.Session()
+            session.mount("http://", _adapter)
+            session.mount("https://", _adapter)
+            return session
+
+        configure_http_backend(backend_factory=backend_factory)
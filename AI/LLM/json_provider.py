@@ -0,0 +1,52 @@
+"""
+Flask/Quart JSON provider backed by orjson.
+
+Classes:
+    OrjsonProvider: Drop-in replacement for Flask's DefaultJSONProvider that uses
+                    orjson for `jsonify` and `request.get_json` when it is installed.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes with orjson, falling back to the stdlib provider without it.
+
+    Keys are emitted in insertion order rather than sorted, and numpy arrays
+    are serialized natively. Types orjson doesn't know go through Flask's
+    default handler (dates, UUIDs, dataclasses, `__html__`).
+
+    Usage:
+        app.json = OrjsonProvider(app)
+    """
+
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if ORJSON_AVAILABLE else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        if not ORJSON_AVAILABLE:
+            return super().dumps(obj, **kwargs)
+        option = self._OPTIONS | (orjson.OPT_INDENT_2 if kwargs.get("indent") else 0)
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if not ORJSON_AVAILABLE:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not ORJSON_AVAILABLE:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._OPTIONS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        # orjson returns UTF-8 bytes, which the response body takes as-is
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype)
@@ -1,10 +1,36 @@
+import atexit
 import json
 import time
+from array import array
+import itertools
+import queue
+import threading
+import concurrent.futures
 from datetime import datetime
 from typing import Dict, Optional
 from collections import Counter
 from .metrics import ResponseMetricsCalculator, MemoryMetrics
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def _dumps(obj) -> str:
+    """Serialize a log record compactly, preferring orjson when it is installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(obj, separators=(',', ':'), default=float)
+
+
+# Queued log lines are written at most this many at a time, and flushed once the queue is idle this long (s)
+WRITE_BATCH_SIZE = 100
+FLUSH_INTERVAL = 0.2
+
+
 class PerformanceLogger:
     """
     A class to log performance metrics for the LLM application with a single timestamp per question.
@@ -12,16 +38,26 @@ class PerformanceLogger:
 
     def __init__(self, log_path: str = "llm_performance.log"):
         self.log_path = log_path
+        self._fp = open(self.log_path, 'a', buffering=1 << 16)
+        # Log lines are handed to a writer thread, so request threads never touch the file
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._drain, name="performance-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)  # The writer is a daemon thread; don't drop queued lines at exit
+        # Quality metrics are computed off the request path, one at a time
+        self._exec = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="quality-metrics")
+        self._entry_ids = itertools.count(1)
         self.start_time = time.time()
         self.metrics = {
             'total_tokens': 0,
             'total_requests': 0,
-            'retrieval_times': [],
-            'validation_times': [],
-            'generation_times': [],
-            'chain of thought_times': [],
+            # Latency accumulators are only summed/averaged, so keep them as unboxed doubles
+            'retrieval_times': array('d'),
+            'validation_times': array('d'),
+            'generation_times': array('d'),
+            'chain of thought_times': array('d'),
             'error_count': 0,
-            'total_processing_times': [],
+            'total_processing_times': array('d'),
             'source_usage': Counter(),
             'intent_usage': Counter(),
             'response_quality_metrics': {
@@ -41,20 +77,62 @@ class PerformanceLogger:
         self.current_timestamp = None
         self.BYTES_TO_KB = 1024
 
+    def close(self) -> None:
+        """Wait for pending quality metrics and queued lines, then flush and close the log file."""
+        self._exec.shutdown(wait=True)
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if not self._fp.closed:
+            self._fp.close()
+
+    def __del__(self):
+        fp = getattr(self, '_fp', None)
+        if fp is not None and not fp.closed:
+            fp.close()
+
+    def _write(self, text: str) -> None:
+        """Queue raw text for the log file (shared with the metrics worker); never blocks on I/O."""
+        self._queue.put_nowait(text)
+
+    def _drain(self) -> None:
+        """Writer thread: append queued lines in batches, flushing whenever the queue goes idle."""
+        unflushed = False
+        while True:
+            try:
+                text = self._queue.get(timeout=FLUSH_INTERVAL if unflushed else None)
+            except queue.Empty:
+                self._fp.flush()
+                unflushed = False
+                continue
+            batch = []
+            while text is not None:
+                batch.append(text)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    text = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._fp.write(''.join(batch))
+                    unflushed = True
+                except Exception as e:
+                    print(f"Error writing performance log: {e}")
+            if text is None:
+                self._fp.flush()
+                return
+
     def set_memory_metrics(self, memory_metrics: MemoryMetrics):
         """Set the MemoryMetrics instance."""
         self.memory_metrics = memory_metrics
 
-    def _format_number(self, value: float) -> float:
-        """Helper method to format numbers to 2 decimal places."""
-        return round(float(value), 2)
-
     def start_new_question(self):
         """Record timestamp for a new question."""
         self.current_timestamp = datetime.now().isoformat()
         # Log the timestamp entry
-        with open(self.log_path, 'a') as f:
-            f.write(json.dumps({'timestamp': self.current_timestamp}) + '\n')
+        self._write(_dumps({'timestamp': self.current_timestamp}) + '\n')
 
     def log_operation(self, operation: str,
                      tokens: Optional[int] = None,
@@ -68,10 +146,11 @@ class PerformanceLogger:
         if self.current_timestamp is None:
             self.start_new_question()
 
+        m = self.metrics
         log_entry = {
             'operation': operation,
             'tokens_used': tokens,
-            'latency': self._format_number(time.time() - start_time) if start_time else None,
+            'latency': round(time.time() - start_time, 2) if start_time else None,
         }
         
         # Add intent information if provided
@@ -79,25 +158,23 @@ class PerformanceLogger:
             log_entry['intent'] = intent
 
         if tokens:
-            self.metrics['total_tokens'] += tokens
+            m['total_tokens'] += tokens
         if start_time:
-            self.metrics[f'{operation}_times'].append(self._format_number(log_entry['latency']))
+            m[f'{operation}_times'].append(log_entry['latency'])
         if is_error:
-            self.metrics['error_count'] += 1
+            m['error_count'] += 1
 
         if memory_usage_before is not None and memory_usage_after is not None:
             memory_delta = (memory_usage_after - memory_usage_before) / self.BYTES_TO_KB
-            log_entry['memory_usage_delta'] = self._format_number(memory_delta)
-            self.metrics['memory_utilization']['memory_usage'].append(self._format_number(memory_delta))
+            log_entry['memory_usage_delta'] = memory_delta = round(memory_delta, 2)
+            m['memory_utilization']['memory_usage'].append(memory_delta)
 
         if operation == 'retrieval':
-            sources = kwargs.get('sources', [])
-            for source in sources:
-                self.metrics['source_usage'][source] += 1
-                
+            m['source_usage'].update(kwargs.get('sources', []))
+
         # Track intent usage for analytics
         if intent:
-            self.metrics['intent_usage'][intent] += 1
+            m['intent_usage'][intent] += 1
 
         if operation in ['generation', 'chain of thought']: #Check if operation in in either of the lists
             question = kwargs.get('question', '')
@@ -105,27 +182,36 @@ class PerformanceLogger:
             response = kwargs.get('response', '')
 
             if question and context and response: # Check that each of the values are available
-                quality_metrics = self.metrics_calculator.get_all_metrics(
-                    question, context, response
-                )
-                formatted_metrics = {
-                    k: self._format_number(v) for k, v in quality_metrics.items()
-                }
-
-                for metric_name, value in formatted_metrics.items():
-                    metric_key = f"{metric_name}s"
-                    self.metrics['response_quality_metrics'][metric_key].append(value)
-
-                log_entry['response_quality_metrics'] = formatted_metrics
+                # Computed in the background; written later as a quality_metrics line with the same id
+                log_entry['id'] = entry_id = next(self._entry_ids)
+                fut = self._exec.submit(self.metrics_calculator.get_all_metrics, question, context, response)
+                fut.add_done_callback(lambda f: self._write_quality(f, entry_id, operation))
             else:
                 print(f"Skipping quality metrics logging for {operation} due to missing question, context, or response.") #Added print statement,
 
-        with open(self.log_path, 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
-            
+        self._write(_dumps(log_entry) + '\n')
+
+    def _write_quality(self, future: concurrent.futures.Future, entry_id: int, operation: str) -> None:
+        """Record quality metrics computed in the background for the log entry `entry_id`."""
+        try:
+            quality_metrics = future.result()
+        except Exception as e:
+            print(f"Quality metrics failed for {operation} (entry {entry_id}): {e}")
+            return
+
+        formatted_metrics = {
+            k: round(v, 2) for k, v in quality_metrics.items()
+        }
+        quality_lists = self.metrics['response_quality_metrics']
+        for metric_name, value in formatted_metrics.items():
+            quality_lists[f"{metric_name}s"].append(value)
+
+        self._write(_dumps({'id': entry_id, 'operation': operation, 'quality_metrics': formatted_metrics}) + '\n')
+
+
     def log_processing_time(self, processing_time: float) -> None:
         """Log the total processing time and reset timestamp."""
-        self.metrics['total_processing_times'].append(self._format_number(processing_time))
+        self.metrics['total_processing_times'].append(round(processing_time, 2))
         self.current_timestamp = None  # Reset timestamp for next question
 
     def get_performance_summary(self, memory) -> Dict:
@@ -133,7 +219,7 @@ class PerformanceLogger:
         avg_quality_metrics = {}
         for metric_name, values in self.metrics['response_quality_metrics'].items():
             if values:
-                avg = self._format_number(sum(values) / len(values))
+                avg = round(sum(values) / len(values), 2)
             else:
                 avg = 0.00
             avg_quality_metrics[f'average_{metric_name[:-1]}'] = avg
@@ -145,25 +231,24 @@ class PerformanceLogger:
 
         summary = {
             'Performance Summary': {
-                'average_retrieval_time': self._format_number(self._calculate_average('retrieval_times')),
-                'average_validation_time': self._format_number(self._calculate_average('validation_times')),
-                'average_generation_time': self._format_number(self._calculate_average('generation_times')),
+                'average_retrieval_time': round(self._calculate_average('retrieval_times'), 2),
+                'average_validation_time': round(self._calculate_average('validation_times'), 2),
+                'average_generation_time': round(self._calculate_average('generation_times'), 2),
                 'total_tokens_processed': self.metrics['total_tokens'],
-                'total_processing_time': self._format_number(sum(self.metrics['total_processing_times'])),
+                'total_processing_time': round(sum(self.metrics['total_processing_times']), 2),
                 'error_count': self.metrics['error_count'],
                 'average_response_quality_metrics': avg_quality_metrics
             },
             'Memory Usage': {
                 'cpu_utilization': cpu_utilization,
-                'memory_usage': self._format_number(memory_usage),
-                'embedding_size': self._format_number(embedding_size)
+                'memory_usage': round(memory_usage, 2),
+                'embedding_size': round(embedding_size, 2)
             },
             'Source Usage': dict(self.metrics['source_usage']),
             'Intent Usage': dict(self.metrics['intent_usage'])
         }
 
-        with open(self.log_path, 'a') as f:
-            f.write(json.dumps(summary) + '\n\n')
+        self._write(_dumps(summary) + '\n\n')
 
         self._reset_metrics()
 
@@ -174,4 +259,4 @@ class PerformanceLogger:
 
     def _reset_metrics(self) -> None:
         """Reset all metrics for the next cycle."""
-        self.metrics['total_processing_times'] = []
\ No newline at end of file
+        self.metrics['total_processing_times'] = array('d')
\ No newline at end of file
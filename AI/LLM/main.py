@@ -6,20 +6,182 @@ Classes:
 """
 
 from huggingface_hub import InferenceClient
+from tenacity import Retrying, retry_if_exception, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
+import chromadb
 
+import hashlib
+import inspect
+import os
+import queue
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import json
+import logging
+from typing import Callable, Optional
 
 from .config import Config
 from .prompts import Prompts
-from .utils import Utils
+from .utils import Utils, PhraseMatcher
 from .logger import PerformanceLogger
 from .metrics import MemoryMetrics
-from .validation import Validator, ValidationError
+from .validation import Validator, ValidationError, history_digest
+from .semantic_cache import SemanticCache, versioned_path
+from .flat_index import FlatIndex
+from .http_pool import use_shared_connection_pool
+from .documents import DocumentStore, document_context_message
+from .error_log import SampledExceptionLogger
+
+log = logging.getLogger(__name__)
+# Inference API outages fail every request the same way; don't format the same traceback for each
+_error_log = SampledExceptionLogger(log)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+_CODE_FENCE_RE = re.compile(r"```(?:json)?")
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json_object(text: str) -> dict:
+    """
+    Return the first JSON object embedded in text.
+
+    Tries a direct parse first (orjson when available), then scans forward from
+    each '{' with JSONDecoder.raw_decode until a complete object decodes.
+
+    Raises:
+        json.JSONDecodeError: If the text contains no JSON object
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            obj = orjson.loads(text)
+            if isinstance(obj, dict):
+                return obj
+        except orjson.JSONDecodeError:
+            pass
+
+    start = text.find('{')
+    while start != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, start)
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            pass
+        start = text.find('{', start + 1)
+    raise json.JSONDecodeError("No JSON object found", text, 0)
+
+# Keyword groups used by _detect_intent, matched in a single scan of the question
+_INTENT_MATCHER = PhraseMatcher({
+    "mal_action": [
+        "take advantage", "advantage of", "sedated patient",
+        "exploit patient", "abuse patient", "inappropriate exam",
+        "sexual harassment", "without consent"
+    ],
+    "mal_context": ["doctor", "physician", "medical", "nurse", "staff"],
+    "plan_request": ["treatment plan", "surgical plan", "complete plan", "entire plan", "dosage", "medication"],
+    "surgical": ["surgical", "surgery"],
+    "medication": ["medication", "dosage"],
+})
+
+# Conditions looked for in the history when the question names none; the first match wins,
+# so more specific names come before the general ones they contain
+_HISTORY_CONDITIONS = (
+    "anaplastic oligodendroglioma", "brain mass", "seizures", "glioma", "tumor",
+    "cancer", "stroke", "heart attack", "pneumonia", "diabetes", "hypertension",
+    "chest pain", "headache", "fever", "covid", "infection", "surgery"
+)
+
+# (max_tokens, temperature) for the main generation, by intent
+_INTENT_GENERATION_PARAMS = {
+    "quick_answer": (800, 0.1),
+    "emergency": (1000, 0.2),
+    "follow_up": (1200, 0.2),  # Increased for follow-up context
+}
+_DETAILED_FOCUS_AREAS = frozenset({"treatment", "surgical_plan", "medications"})
+_DETAILED_PARAMS = (1500, 0.2)  # Increased for detailed treatment plans
+_HIGH_URGENCY_PARAMS = (1000, 0.2)
+_DEFAULT_PARAMS = (1200, 0.3)  # Default increased for comprehensive responses
+
+
+def _generation_params(intent_data: dict) -> tuple:
+    """Return (max_tokens, temperature) for the main generation given the detected intent."""
+    intent = intent_data.get('intent')
+    params = _INTENT_GENERATION_PARAMS.get(intent)
+    if params is not None:
+        return params
+    if intent == 'specific_info' and intent_data.get('focus_area') in _DETAILED_FOCUS_AREAS:
+        return _DETAILED_PARAMS
+    if intent_data.get('urgency') == 'high':
+        return _HIGH_URGENCY_PARAMS
+    return _DEFAULT_PARAMS
+
+
+# Questions at most this long (and with at most this many spaces) become their own heading
+_SHORT_HEADING_CHARS = 60
+_SHORT_HEADING_SPACES = 8
+
+# Intents whose answers are short enough that a chain-of-thought pass isn't worth its latency
+_NO_COT_INTENTS = frozenset({"quick_answer", "emergency"})
+_SHORT_FOLLOW_UP_CHARS = 120
+
+
+def _cot_max_tokens(intent_data: dict, question: str) -> int:
+    """Return the token budget for the chain-of-thought pass, or 0 to skip it."""
+    intent = intent_data.get('intent')
+    if intent in _NO_COT_INTENTS or (intent == 'follow_up' and len(question) < _SHORT_FOLLOW_UP_CHARS):
+        return 0
+    if intent == 'specific_info':
+        return 800
+    return 2000
+
+
+# Lines of a long AI response that carry medical specifics worth keeping in the history summary
+_MEDICAL_SPECIFICS_LINE_RE = re.compile(
+    r"(?im)^.*(?:diagnosis|condition|treatment|medication|patient|symptoms|surgery|procedure):.*$"
+)
+
+
+@lru_cache(maxsize=512)
+def _format_history_turn(human_msg: str, ai_msg: str) -> str:
+    """
+    Format one question/response turn for the conversation history.
+
+    Earlier turns are resent with every request, so the result is cached by content and
+    each turn is only summarized once per conversation.
+    """
+    # Truncate very long AI responses but preserve key medical context
+    if len(ai_msg) > 800:
+        # First lines for context, plus any lines naming diagnoses, conditions, treatments
+        key_lines = [line.strip() for line in ai_msg.split('\n', 5)[:5]]
+        condition_lines = []
+        for match in _MEDICAL_SPECIFICS_LINE_RE.finditer(ai_msg):
+            condition_lines.append(match.group().strip())
+            if len(condition_lines) == 5:
+                break
+        ai_msg = '\n'.join(key_lines) + '\n...\n' + '\n'.join(condition_lines)
+    return f"Previous Question: {human_msg}\nPrevious Response Summary: {ai_msg}"
+
+
+def _prompts_version() -> str:
+    """Digest of the Prompts class source (templates and the code assembling them)."""
+    try:
+        source = inspect.getsource(Prompts)
+    except (OSError, TypeError):
+        return ""
+    return hashlib.blake2b(source.encode(), digest_size=8).hexdigest()
+
 
 class SurgicalLLM:
     """
@@ -30,14 +192,19 @@ class SurgicalLLM:
         logger: Performance logging instance
         embeddings: Text embeddings model
         vectordb: Vector database instance
+        document_store: Chunked, embedded copies of uploaded documents
         chat: LLM chat instance
         memory_metrics: Memory metrics instance
     """
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, preload: bool = True):
         """
         Initialize the SurgicalLLM class.
 
+        Args:
+            config: Application configuration
+            preload: Start loading the heavy components on a background thread right away
+
         Raises:
             ValueError: If HF_TOKEN is not found in configuration
         """
@@ -53,89 +220,263 @@ class SurgicalLLM:
         self.vectordb = None
         self.memory_metrics = None
         self.client = None
+        self.quick_client = None
         self.validator = None
+        self.retrieval_cache = None
+        self.response_cache = None
+        self.flat_index = None
+        self.document_store = None
+        self._io_pool = None
+        # Per-instance cache, so it's released with the instance rather than keeping it alive
+        self._llm_heading = lru_cache(maxsize=1024)(self._request_llm_heading)
         self._initialized = False
-        
-        print("SurgicalLLM basic initialization completed. Heavy models will be loaded on first use.")
+        self._init_lock = threading.Lock()
+
+        if preload:
+            # Load models while the service starts up, so the first request doesn't pay for it
+            threading.Thread(target=self._preload, daemon=True).start()
+            print("SurgicalLLM basic initialization completed. Heavy models are loading in the background.")
+        else:
+            print("SurgicalLLM basic initialization completed. Heavy models will be loaded on first use.")
+
+    def _preload(self):
+        """Background-thread entry point for `_ensure_initialized`."""
+        try:
+            self._ensure_initialized()
+        except Exception as e:
+            # The next request retries initialization and reports the error itself
+            print(f"Background initialization failed: {e}")
 
     def _ensure_initialized(self):
-        """Initialize heavy components if not already done."""
+        """Initialize heavy components if not already done; concurrent callers wait for one load."""
         if self._initialized:
             return
-            
+        with self._init_lock:
+            if not self._initialized:
+                self._initialize_components()
+
+    def _initialize_components(self):
+        """Load embeddings, vector database, inference client and validator."""
         print("Initializing heavy LLM components...")
-        
-        try:
-            print("Loading embeddings...")
-            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-l6-v2")
-            print("Embeddings loaded successfully")
-        except Exception as e:
-            print(f"Error loading embeddings: {e}")
-            raise e
-            
-        try:
-            print("Loading vector database...")
-            self.vectordb = Chroma(persist_directory=self.config.VECTOR_DB_PATH, embedding_function=self.embeddings)
-            print("Vector database loaded successfully")
-        except Exception as e:
-            print(f"Error loading vector database: {e}")
-            raise e
-            
-        try:
-            print("Loading memory metrics...")
-            self.memory_metrics = MemoryMetrics(self.config.VECTOR_DB_PATH)
+        # Concurrent requests share warm connections to the inference API instead of one pool per thread
+        use_shared_connection_pool(self.config.HTTP_POOL_SIZE)
+
+        # Components with no dependencies on each other, loaded in parallel
+        independent_loaders = [
+            ("embeddings", self._load_embeddings, {}),
+            ("vector database client", chromadb.PersistentClient, {"path": self.config.VECTOR_DB_PATH}),
+            ("memory metrics", MemoryMetrics, {"vectordb_path": self.config.VECTOR_DB_PATH}),
+            ("inference client", InferenceClient, {
+                "model": Config.MODEL_NAME,
+                "token": Config.HF_TOKEN,
+                "timeout": 60  # Set 60 second timeout for paid tier
+            }),
+            # Separate client for quick operations like intent detection; both share the pooled connections
+            ("quick inference client", InferenceClient, {
+                "model": Config.MODEL_NAME,
+                "token": Config.HF_TOKEN,
+                "timeout": 30  # Shorter timeout for intent detection
+            }),
+            # Near-duplicate questions reuse earlier verdicts
+            ("validation cache", SemanticCache, {
+                "capacity": self.config.SEMANTIC_CACHE_SIZE,
+                "threshold": self.config.VALIDATION_CACHE_THRESHOLD,
+                "path": os.path.join(self.config.VECTOR_DB_PATH, "validation_cache.pkl")
+            }),
+        ]
+
+        with ThreadPoolExecutor(max_workers=4) as loader:
+            print(f"Loading {', '.join(name for name, _, _ in independent_loaders)}...")
+            futures = {name: loader.submit(load, **kwargs) for name, load, kwargs in independent_loaders}
+
+            # The validator only needs the client and memory metrics; it loads its tokenizer while embeddings finish
+            self.memory_metrics = self._await_component("memory metrics", futures["memory metrics"])
             self.logger.set_memory_metrics(self.memory_metrics)
-            print("Memory metrics loaded successfully")
-        except Exception as e:
-            print(f"Error loading memory metrics: {e}")
-            raise e
-            
-        try:
-            print("Loading inference client...")
-            self.client = InferenceClient(
-                model=Config.MODEL_NAME,
-                token=Config.HF_TOKEN,
-                timeout=60  # Set 60 second timeout for paid tier
+            self.client = self._await_component("inference client", futures["inference client"])
+            self.quick_client = self._await_component("quick inference client", futures["quick inference client"])
+            validation_cache = self._await_component("validation cache", futures["validation cache"])
+            validator_future = loader.submit(Validator, self.client, self.memory_metrics, self.logger, validation_cache)
+
+            self.embeddings = self._await_component("embeddings", futures["embeddings"])
+            chroma_client = self._await_component("vector database client", futures["vector database client"])
+            try:
+                self.vectordb = Chroma(client=chroma_client, embedding_function=self.embeddings)
+            except Exception as e:
+                print(f"Error loading vector database: {e}")
+                raise e
+
+            # Near-duplicate questions reuse earlier retrieval results and answers; the cache files are
+            # tied to the ingested collection, so results from before a re-ingest are never served
+            knowledge_base_version = self._knowledge_base_version()
+            retrieval_cache_future = loader.submit(
+                SemanticCache,
+                capacity=self.config.SEMANTIC_CACHE_SIZE,
+                threshold=self.config.SEMANTIC_CACHE_THRESHOLD,
+                path=versioned_path(os.path.join(self.config.VECTOR_DB_PATH, "retrieval_cache.pkl"),
+                                    *knowledge_base_version)
             )
-            
-            # Create a separate client for quick operations like intent detection
-            self.quick_client = InferenceClient(
-                model=Config.MODEL_NAME,
-                token=Config.HF_TOKEN,
-                timeout=30  # Shorter timeout for intent detection
+            # Answers also depend on the model and prompts, and go stale as guidance changes
+            response_cache_future = loader.submit(
+                SemanticCache,
+                capacity=self.config.SEMANTIC_CACHE_SIZE,
+                threshold=self.config.SEMANTIC_CACHE_THRESHOLD,
+                path=versioned_path(os.path.join(self.config.VECTOR_DB_PATH, "response_cache.pkl"),
+                                    Config.MODEL_NAME, _prompts_version(), *knowledge_base_version),
+                ttl=self.config.RESPONSE_CACHE_TTL
             )
-            print("Inference clients loaded successfully")
-        except Exception as e:
-            print(f"Error loading inference client: {e}")
-            raise e
+
+            # Uploaded documents are embedded once, then retrieved by chunk on later turns
+            try:
+                self.document_store = DocumentStore(
+                    self.embeddings,
+                    capacity=self.config.DOCUMENT_STORE_SIZE,
+                    chunk_words=self.config.DOCUMENT_CHUNK_WORDS,
+                    chunk_overlap=self.config.DOCUMENT_CHUNK_OVERLAP
+                )
+            except Exception as e:
+                print(f"Warning: Could not create document store, documents will be sent whole: {e}")
+                self.document_store = None
+
+            self.retrieval_cache = self._await_component("retrieval cache", retrieval_cache_future)
+            self.response_cache = self._await_component("response cache", response_cache_future)
+            self.validator = self._await_component("validator", validator_future)
+
+        if self.config.USE_FLAT_INDEX:
+            try:
+                print("Loading flat vector index...")
+                self.flat_index = FlatIndex(self.vectordb._collection)
+                print(f"Flat vector index loaded with {len(self.flat_index)} vectors")
+            except Exception as e:
+                print(f"Warning: Could not build flat vector index, using Chroma search: {e}")
+                self.flat_index = None
+
+        # Each request's heading is generated here while the request thread validates and detects intent;
+        # one slot per request thread, so headings never queue behind other requests
+        self._io_pool = ThreadPoolExecutor(max_workers=self.config.LLM_IO_THREADS, thread_name_prefix="llm-io")
             
+        self._initialized = True
+        print("All LLM components initialized successfully!")
+
+    def _knowledge_base_version(self) -> tuple:
+        """Ingest stamp written by data_processor.py and chunk count of the loaded collection."""
         try:
-            print("Loading validator...")
-            self.validator = Validator(self.client, self.memory_metrics, self.logger)
-            print("Validator loaded successfully")
+            with open(os.path.join(self.config.VECTOR_DB_PATH, Config.INGEST_STAMP_FILE)) as f:
+                stamp = f.read().strip()
+        except OSError:
+            stamp = ""
+        return stamp, self.vectordb._collection.count()
+
+    @staticmethod
+    def _await_component(name: str, future):
+        """Wait for a component being loaded by `_initialize_components`, reporting the outcome."""
+        try:
+            component = future.result()
         except Exception as e:
-            print(f"Error loading validator: {e}")
+            print(f"Error loading {name}: {e}")
             raise e
-            
-        self._initialized = True
-        print("All LLM components initialized successfully!")
+        print(f"Loaded {name} successfully")
+        return component
+
+    def _load_embeddings(self) -> HuggingFaceEmbeddings:
+        """
+        Load the query embeddings model, preferring its graph-optimized ONNX export.
+
+        ONNX Runtime runs MiniLM several times faster than eager PyTorch on CPU; if the
+        ONNX backend or export is unavailable, the plain PyTorch model is used instead.
+        """
+        onnx_file = self.config.EMBEDDINGS_ONNX_FILE
+        if onnx_file:
+            try:
+                return HuggingFaceEmbeddings(
+                    model_name=self.config.EMBEDDINGS_MODEL,
+                    model_kwargs={"backend": "onnx", "model_kwargs": {"file_name": onnx_file}}
+                )
+            except Exception as e:
+                print(f"Warning: Could not load ONNX embeddings ({onnx_file}), falling back to PyTorch: {e}")
+        return HuggingFaceEmbeddings(model_name=self.config.EMBEDDINGS_MODEL)
+
+    @staticmethod
+    def _retrying(max_attempts: int, retry=retry_if_exception_type(Exception)) -> Retrying:
+        """Build the retry policy for LLM calls: jittered exponential backoff, last error re-raised."""
+        return Retrying(
+            stop=stop_after_attempt(max_attempts),
+            wait=wait_exponential_jitter(initial=1, max=30),
+            retry=retry,
+            before_sleep=lambda state: print(
+                f"[RETRY] LLM request attempt {state.attempt_number}/{max_attempts} failed: "
+                f"{state.outcome.exception()}"
+            ),
+            reraise=True
+        )
+
+    def _chat_completion_with_retry(self, client: InferenceClient, max_attempts: int, **kwargs):
+        """
+        Call `client.chat_completion`, retrying failures with jittered exponential backoff.
+
+        Args:
+            client: Inference client to call
+            max_attempts: Total number of attempts before the last error is re-raised
+            **kwargs: Arguments for `chat_completion`
+
+        Returns:
+            The chat completion response
+        """
+        return self._retrying(max_attempts)(client.chat_completion, **kwargs)
+
+    def _stream_completion_with_retry(self, max_attempts: int, on_token: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+        """
+        Stream a chat completion from the main client and return the full text.
+
+        Each token is passed to `on_token` as it arrives. A failed attempt is only
+        retried if no tokens were delivered yet, so callers never see text twice.
+
+        Args:
+            max_attempts: Total number of attempts before the last error is re-raised
+            on_token: Optional callback receiving each generated text fragment
+            **kwargs: Arguments for `chat_completion`
+
+        Returns:
+            The concatenated response text
+        """
+        chunks = []
+
+        def stream():
+            for event in self.client.chat_completion(stream=True, **kwargs):
+                if not event.choices:
+                    continue
+                token = event.choices[0].delta.content
+                if token:
+                    chunks.append(token)
+                    if on_token is not None:
+                        on_token(token)
+            return "".join(chunks)
+
+        return self._retrying(max_attempts, retry=retry_if_exception(lambda _: not chunks))(stream)
 
     def _generate_heading(self, question: str) -> str:
-        """Generate a heading for the question using the LLM."""
+        """Generate a heading for the question; short questions are used as their own heading."""
+        text = question.strip()
+        if text and len(text) <= _SHORT_HEADING_CHARS and text.count(' ') <= _SHORT_HEADING_SPACES:
+            # Capitalize each word without lowercasing the rest, so acronyms like MRI survive
+            return ' '.join(word[:1].upper() + word[1:] for word in text.rstrip('?.!').split())
+
         self._ensure_initialized()
-        heading_messages = Prompts.build_prompt(prompt_type="heading", question=question)
         try:
-            response = self.client.chat_completion(
-                messages=heading_messages,
-                max_tokens=12,
-                temperature=0.5,
-            )
-            heading = response.choices[0].message.content.strip('"')
-            return heading
+            return self._llm_heading(question)
         except Exception as e:
             print(f"Error generating heading: {e}")
             return f"{question[:50]}..."
 
+    def _request_llm_heading(self, question: str) -> str:
+        """Ask the LLM for a heading; cached per question as `_llm_heading`, failures are not cached."""
+        heading_messages = Prompts.build_prompt(prompt_type="heading", question=question)
+        response = self.client.chat_completion(
+            messages=heading_messages,
+            max_tokens=12,
+            temperature=0.5,
+        )
+        return response.choices[0].message.content.strip('"')
+
     def _generate_clarification_response(self, intent_data: dict, question: str) -> str:
         """Generate a clarification question for ambiguous queries."""
         needs_clarification = intent_data.get("needs_clarification", "")
@@ -178,15 +519,12 @@ class SurgicalLLM:
         try:
             # Check for malicious patterns FIRST
             question_lower = question.lower()
+            hits = _INTENT_MATCHER.hits(question_lower)
             
             # Explicit malicious pattern detection
-            if any(phrase in question_lower for phrase in [
-                "take advantage", "advantage of", "sedated patient",
-                "exploit patient", "abuse patient", "inappropriate exam",
-                "sexual harassment", "without consent"
-            ]):
+            if "mal_action" in hits:
                 # If any context suggests doctor/medical professional exploitation
-                if any(word in question_lower for word in ["doctor", "physician", "medical", "nurse", "staff"]):
+                if "mal_context" in hits:
                     # Return a special malicious intent that will be handled
                     return {
                         "intent": "malicious",
@@ -196,78 +534,42 @@ class SurgicalLLM:
                         "needs_clarification": ""
                     }
             
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    print(f"[DEBUG] Intent detection attempt {attempt + 1}/{max_retries}")
-                    intent_messages = Prompts.build_prompt(
-                        prompt_type="intent_detection", 
-                        history=history_text, 
-                        question=question
-                    )
-                    
-                    # Use quick client with shorter timeout for intent detection
-                    response = self.quick_client.chat_completion(
-                        messages=intent_messages,
-                        max_tokens=250,  # Increased to prevent truncation
-                        temperature=0.1,
-                        top_p=0.9
-                    )
-                    print(f"[DEBUG] Intent detection completed successfully on attempt {attempt + 1}")
-                    
-                    # Debug: Print the raw response
-                    raw_response = response.choices[0].message.content
-                    print(f"[DEBUG] Raw intent detection response: '{raw_response}'")
-                    
-                    break
-                    
-                except Exception as e:
-                    print(f"[ERROR] Intent detection attempt {attempt + 1} failed: {str(e)}")
-                    if attempt == max_retries - 1:
-                        print(f"[ERROR] All intent detection attempts failed, using fallback")
-                        # Return default intent when all attempts fail
-                        return {
-                            "intent": "medical",
-                            "urgency": "medium", 
-                            "main_condition": "unknown",
-                            "focus_area": "general",
-                            "needs_clarification": ""
-                        }
-                    else:
-                        print(f"[DEBUG] Retrying intent detection in {2 ** attempt} seconds...")
-                        import time
-                        time.sleep(2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
+            intent_messages = Prompts.build_prompt(
+                prompt_type="intent_detection", 
+                history=history_text, 
+                question=question
+            )
+            try:
+                # Use quick client with shorter timeout for intent detection
+                response = self._chat_completion_with_retry(
+                    self.quick_client,
+                    max_attempts=3,
+                    messages=intent_messages,
+                    max_tokens=250,  # Increased to prevent truncation
+                    temperature=0.1,
+                    top_p=0.9
+                )
+            except Exception as e:
+                print(f"[ERROR] All intent detection attempts failed, using fallback: {e}")
+                # Return default intent when all attempts fail
+                return {
+                    "intent": "medical",
+                    "urgency": "medium", 
+                    "main_condition": "unknown",
+                    "focus_area": "general",
+                    "needs_clarification": ""
+                }
                         
             raw_content = response.choices[0].message.content
-            print(f"[DEBUG] Attempting to parse JSON: '{raw_content}'")
-            
-            # Clean the response to extract JSON
-            cleaned_content = raw_content.strip()
-            
-            # Remove markdown code blocks if present
-            if "```json" in cleaned_content:
-                start = cleaned_content.find("```json") + 7
-                end = cleaned_content.find("```", start)
-                if end != -1:
-                    cleaned_content = cleaned_content[start:end].strip()
-                else:
-                    cleaned_content = cleaned_content[start:].strip()
-            
-            # Find JSON object boundaries
-            if cleaned_content.startswith('{') and '}' in cleaned_content:
-                end_brace = cleaned_content.rfind('}')
-                cleaned_content = cleaned_content[:end_brace + 1]
-            elif '{' in cleaned_content:
-                start_brace = cleaned_content.find('{')
-                if '}' in cleaned_content[start_brace:]:
-                    end_brace = cleaned_content.rfind('}')
-                    cleaned_content = cleaned_content[start_brace:end_brace + 1]
+            log.debug("Attempting to parse intent JSON: %r", raw_content)
             
-            print(f"[DEBUG] Cleaned JSON content: '{cleaned_content}'")
+            # Strip markdown code fences, then take the first complete JSON object
+            cleaned_content = _CODE_FENCE_RE.sub("", raw_content).strip()
+            log.debug("Cleaned intent JSON content: %r", cleaned_content)
             
             try:
-                intent_data = json.loads(cleaned_content)
-                print(f"[DEBUG] JSON parsing successful: {intent_data}")
+                intent_data = _extract_json_object(cleaned_content)
+                log.debug("Intent JSON parsed: %s", intent_data)
             except json.JSONDecodeError as json_error:
                 print(f"[ERROR] JSON parsing failed after cleaning: {json_error}")
                 print(f"[ERROR] Cleaned content that failed to parse: '{cleaned_content}'")
@@ -277,102 +579,86 @@ class SurgicalLLM:
             if not intent_data.get("main_condition") and history_text:
                 # Extract condition from history if current question doesn't have one (e.g., "now give me the treatment plan")
                 history_lower = history_text.lower()
-                medical_conditions = [
-                    "anaplastic oligodendroglioma", "brain mass", "seizures", "glioma", "tumor", 
-                    "cancer", "stroke", "heart attack", "pneumonia", "diabetes", "hypertension",
-                    "chest pain", "headache", "fever", "covid", "infection", "surgery"
-                ]
-                
-                for condition in medical_conditions:
-                    if condition in history_lower:
-                        intent_data["main_condition"] = condition.replace(" ", "_")
-                        break
+                condition = next((c for c in _HISTORY_CONDITIONS if c in history_lower), None)
+                if condition:
+                    intent_data["main_condition"] = condition.replace(" ", "_")
             
             # Enhanced intent classification for common patterns
-            question_lower = question.lower()
-            if any(phrase in question_lower for phrase in ["treatment plan", "surgical plan", "complete plan", "entire plan", "dosage", "medication"]):
+            if "plan_request" in hits:
                 intent_data["intent"] = "specific_info"
-                if "surgical" in question_lower or "surgery" in question_lower:
+                if "surgical" in hits:
                     intent_data["focus_area"] = "surgical_plan"
-                elif "medication" in question_lower or "dosage" in question_lower:
+                elif "medication" in hits:
                     intent_data["focus_area"] = "medications"
                 else:
                     intent_data["focus_area"] = "treatment"
             
-            print(f"[DEBUG] Detected intent: {intent_data}")
+            log.debug("Detected intent: %s", intent_data)
             return intent_data
             
         except Exception as e:
-            print(f"[ERROR] Intent detection failed completely: {e}")
-            import traceback
-            traceback.print_exc()
+            _error_log.exception("Intent detection failed completely", e)
             # Return basic fallback
             return {"intent": "full_analysis", "focus_area": "", "urgency": "medium", "requires_full_structure": True, "main_condition": "", "needs_clarification": ""}
 
-    def _format_conversation_history(self, memory, question: str) -> str:
-        """Format conversation history from memory with enhanced context preservation."""
+    def _format_conversation_history(self, memory, question: str, system_prefix: Optional[dict] = None) -> str:
+        """
+        Format conversation history from memory with enhanced context preservation.
+
+        `system_prefix` is read as if it were prepended to a list history, without copying the list.
+        """
         if memory is None:
-            print("[DEBUG] No memory available, returning empty history")
-            return ""
+            if system_prefix is None:
+                log.debug("No memory available, returning empty history")
+                return ""
+            memory = []
         
         # Handle both list (from backend) and memory object
         if isinstance(memory, list):
-            print(f"[DEBUG] Memory is a list with {len(memory)} items")
+            log.debug("Memory is a list with %d items", len(memory))
             history_data = memory
         else:
             # Memory object from LangChain
             conversation_history = memory.load_memory_variables({"input": question})
-            print(f"[DEBUG] Loaded conversation_history: {conversation_history}")
+            log.debug("Loaded conversation_history: %s", conversation_history)
             history_data = conversation_history.get("history", "")
         
-        print(f"[DEBUG] Extracted history_data: {history_data}")
+        log.debug("Extracted history_data: %s", history_data)
         
         if isinstance(history_data, list):
+            offset = 1 if system_prefix is not None else 0
+            total = len(history_data) + offset
+
+            def message_at(j):
+                return system_prefix if j < offset else history_data[j - offset]
+
             formatted_history = []
-            # Process messages in pairs (assuming even index = human, odd index = AI)
-            for i in range(0, len(history_data), 2):
+            # Process messages in pairs (assuming even index = human, odd index = AI),
+            # keeping only the most recent 10 interactions to maintain relevant context
+            num_pairs = (total + 1) // 2
+            for i in range(2 * max(0, num_pairs - 10), total, 2):
                 # Handle both dict format (from backend) and message object format
-                if isinstance(history_data[i], dict):
-                    human_msg = history_data[i].get('content', '').replace('Human:', '').strip()
+                human = message_at(i)
+                if isinstance(human, dict):
+                    human_msg = human.get('content', '').replace('Human:', '').strip()
                 else:
-                    human_msg = history_data[i].content.replace('Human:', '').strip()
+                    human_msg = human.content.replace('Human:', '').strip()
                 
                 ai_msg = ""
-                if i + 1 < len(history_data):
-                    if isinstance(history_data[i + 1], dict):
-                        ai_msg = history_data[i + 1].get('content', '').strip()
+                if i + 1 < total:
+                    ai = message_at(i + 1)
+                    if isinstance(ai, dict):
+                        ai_msg = ai.get('content', '').strip()
                     else:
-                        ai_msg = history_data[i + 1].content.strip()
-                    # Truncate very long AI responses but preserve key medical context
-                    if len(ai_msg) > 800:
-                        # Extract key medical information from the start and any diagnoses/conditions mentioned
-                        lines = ai_msg.split('\n')
-                        key_lines = []
-                        condition_lines = []
-                        
-                        for line in lines[:10]:  # First 10 lines for context
-                            key_lines.append(line.strip())
-                            
-                        # Look for specific medical conditions, diagnoses, treatments mentioned
-                        for line in lines:
-                            if any(keyword in line.lower() for keyword in ['diagnosis:', 'condition:', 'treatment:', 'medication:', 'patient:', 'symptoms:', 'surgery:', 'procedure:']):
-                                condition_lines.append(line.strip())
-                        
-                        # Combine key context with medical specifics
-                        preserved_context = '\n'.join(key_lines[:5]) + '\n...\n' + '\n'.join(condition_lines[:5])
-                        ai_msg = preserved_context
+                        ai_msg = ai.content.strip()
                 
-                formatted_history.append(f"Previous Question: {human_msg}\nPrevious Response Summary: {ai_msg}")
-            
-            # Keep the most recent 10 interactions to maintain relevant context
-            if len(formatted_history) > 10:
-                formatted_history = formatted_history[-10:]
+                formatted_history.append(_format_history_turn(human_msg, ai_msg))
                 
             final_history = "\n\n".join(formatted_history)
-            print(f"[DEBUG] Formatted conversation history: {final_history[:500]}...")
+            log.debug("Formatted conversation history: %.500s...", final_history)
             return final_history
         
-        print("[DEBUG] history_data is not a list, returning empty string")
+        log.debug("history_data is not a list, returning empty string")
         return ""
 
     def _process_retrieved_docs(self, retrieved_docs) -> list:
@@ -389,13 +675,38 @@ class SurgicalLLM:
         context = "\n\n".join(doc.page_content for doc in retrieved_docs)
         return source_links, sources, context
     
-    def QA(self, question: str, memory) -> tuple[str, list, str, dict]:
+    def _document_context(self, question: str, document: str) -> tuple[dict, Optional[list]]:
+        """
+        System message for an uploaded document, and the question embedding if it was computed.
+
+        Short documents are sent whole. Longer ones go through the document store, which
+        embeds them once; each turn then sends only the chunks closest to the question.
+        """
+        if self.document_store is None or len(document.split()) <= self.config.DOCUMENT_INLINE_MAX_WORDS:
+            return document_context_message(document), None
+        try:
+            query_embedding = self.embeddings.embed_query(question)
+            chunks = self.document_store.relevant_chunks(document, query_embedding, k=self.config.DOCUMENT_TOP_K)
+        except Exception as e:
+            print(f"Error retrieving document chunks, sending the whole document: {e}")
+            return document_context_message(document), None
+        log.debug("Using %d chunks of the uploaded document", len(chunks))
+        return document_context_message("\n\n[...]\n\n".join(chunks)), query_embedding
+
+    def QA(self, question: str, memory, on_token: Optional[Callable[[str], None]] = None,
+           system_prefix: Optional[dict] = None, document: Optional[str] = None) -> tuple[str, list, str, dict]:
         """
         Process a medical question through the full QA pipeline.
 
         Args:
             question: User's input question
             memory: Conversation memory object
+            on_token: Optional callback receiving the raw answer text as it streams in
+            system_prefix: Optional system message (e.g. a custom system prompt) treated as
+                the first message of a list history
+            document: Optional uploaded document text (OCR), used as the system message
+                when there is no `system_prefix`; long documents are cut down to the
+                chunks relevant to the question
 
         Returns:
             Tuple containing:
@@ -409,32 +720,48 @@ class SurgicalLLM:
         
         processing_start_time = time.time()
 
-        # Generate heading
-        heading = self._generate_heading(question)
+        query_embedding = None
+        if document and system_prefix is None:
+            system_prefix, query_embedding = self._document_context(question, document)
 
         # Process conversation history
-        history_text = self._format_conversation_history(memory, question)
+        history_text = self._format_conversation_history(memory, question, system_prefix)
 
-        # Validate question
+        # The heading is needed for every reply, even a rejection, so it's generated alongside the rest
+        heading_future = self._io_pool.submit(self._generate_heading, question)
+
+        # Embed the question once; it keys the validation and response caches and drives retrieval
+        try:
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(question)
+            # Single FP32 conversion shared by the caches and the flat index (MiniLM outputs FP32)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+        except Exception as e:
+            print(f"Error embedding question: {e}")
+            query_embedding = query_vector = None
+
+        # Validate question while the heading call is in flight
         try:
-            valid, message = self.validator.validate(question, history_text)
+            valid, message = self.validator.validate(question, history_text, question_embedding=query_vector)
             if not valid:
                 self.logger.log_processing_time(time.time() - processing_start_time)
-                return message, [], heading, {"intent": "validation_failed", "urgency": "low"}
+                return message, [], heading_future.result(), {"intent": "validation_failed", "urgency": "low"}
         except ValidationError as ve:
-            return str(ve), [], heading, {"intent": "validation_error", "urgency": "low"}
-            
-        # Detect intent for dynamic response
+            return str(ve), [], heading_future.result(), {"intent": "validation_error", "urgency": "low"}
+
+        # Intent is only worth an LLM call once the question has passed validation
         intent_data = self._detect_intent(question, history_text)
-        print(f"[DEBUG] Using intent data: {intent_data}")
+        heading = heading_future.result()
+        intent = intent_data.get("intent")
+        log.debug("Using intent data: %s", intent_data)
         
         # Handle malicious intent immediately
-        if intent_data.get("intent") == "malicious":
+        if intent == "malicious":
             self.logger.log_processing_time(time.time() - processing_start_time)
             return "I can't help with that request.", [], heading, {"intent": "malicious", "urgency": "blocked"}
         
         # Handle clarification needed
-        if intent_data.get("intent") == "clarification_needed":
+        if intent == "clarification_needed":
             clarification_response = self._generate_clarification_response(intent_data, question)
             response_metadata = {
                 "intent": "clarification_needed",
@@ -445,22 +772,50 @@ class SurgicalLLM:
             self.logger.log_processing_time(time.time() - processing_start_time)
             return clarification_response, [], heading, response_metadata
 
+        # A near-identical question with the same intent and history was answered already
+        response_tag = f"{intent}:{history_digest(history_text)}"
+        if query_vector is not None:
+            cached_response = self.response_cache.lookup(query_vector, tag=response_tag)
+            if cached_response is not None:
+                cleaned_response, source_links, response_metadata = cached_response
+                if on_token is not None:
+                    on_token(cleaned_response)
+                if memory is not None and not isinstance(memory, list):
+                    memory.save_context({"input": question}, {"response": cleaned_response})
+                self.logger.log_processing_time(time.time() - processing_start_time)
+                return cleaned_response, source_links, heading, response_metadata
+
         # If question is valid, retrieve the relevant documents
         retrieval_start = time.time()
         memory_usage_before = self.memory_metrics.get_memory_usage()  # Memory before retrieval
-        retriever = self.vectordb.as_retriever(search_type="mmr", search_kwargs={"k": 3})
         try:
-            retrieved_docs = retriever.invoke(question)
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(question)
+                query_vector = np.asarray(query_embedding, dtype=np.float32)
+            retrieved_docs = self.retrieval_cache.lookup(query_vector)
+            if retrieved_docs is None:
+                if self.flat_index is not None:
+                    retrieved_docs = self.flat_index.max_marginal_relevance_search_by_vector(query_vector, k=3, fetch_k=20)
+                else:
+                    retrieved_docs = self.vectordb.max_marginal_relevance_search_by_vector(query_embedding, k=3, fetch_k=20)
+                self.retrieval_cache.add(query_vector, retrieved_docs)
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             retrieved_docs = []
 
-        # Record embedding size during retrieval (or wherever embeddings are generated)
-        for doc in retrieved_docs:
-            embedding = self.embeddings.embed_query(doc.page_content) #Or embed_documents if not using query
-            embedding = np.array(embedding) #Converting list to np array
-
-            self.memory_metrics.record_embedding_size(embedding)
+        # Record embedding size during retrieval, reusing the vectors Chroma already stores
+        if retrieved_docs:
+            doc_ids = [getattr(doc, "id", None) for doc in retrieved_docs]
+            embeddings = None
+            if all(doc_ids):
+                try:
+                    embeddings = self.vectordb._collection.get(ids=doc_ids, include=["embeddings"])["embeddings"]
+                except Exception as e:
+                    print(f"Error fetching stored embeddings: {e}")
+            if embeddings is None or len(embeddings) != len(retrieved_docs):
+                # One batched forward pass instead of one per document
+                embeddings = self.embeddings.embed_documents([doc.page_content for doc in retrieved_docs])
+            self.memory_metrics.record_embedding_batch(np.asarray(embeddings, dtype=np.float32))
 
         memory_usage_after = self.memory_metrics.get_memory_usage()  # Memory after retrieval
 
@@ -475,37 +830,41 @@ class SurgicalLLM:
         )
 
         # Generate response
-        try:
-            # Chain of thought generation
-            cotMessages = Prompts.build_prompt(prompt_type="cot", history=history_text, context=context, question=question)
-            generation_start = time.time()
-            memory_usage_before = self.memory_metrics.get_memory_usage() 
+        cot_max_tokens = _cot_max_tokens(intent_data, question)
+        if not cot_max_tokens:
+            cotResponseText = ""  # Quick, emergency and short follow-up answers go straight to the main prompt
+        else:
+            try:
+                # Chain of thought generation
+                cotMessages = Prompts.build_prompt(prompt_type="cot", history=history_text, context=context, question=question)
+                generation_start = time.time()
+                memory_usage_before = self.memory_metrics.get_memory_usage() 
 
-            # Count tokens and generate
-            input_tokens = self.utils.count_tokens(str(cotMessages))
-            cotResponse = self.client.chat_completion(
-                messages=cotMessages,
-                max_tokens=2000,
-            )
-            cotResponseText = cotResponse.choices[0].message.content.strip()
-            print("--------------------------\nCOT Response: \n", cotResponseText)
-            output_tokens = self.utils.count_tokens(cotResponseText)
+                # Count tokens and generate
+                input_tokens = self.utils.count_message_tokens(cotMessages)
+                cotResponse = self.client.chat_completion(
+                    messages=cotMessages,
+                    max_tokens=cot_max_tokens,
+                )
+                cotResponseText = cotResponse.choices[0].message.content.strip()
+                log.debug("COT Response:\n%s", cotResponseText)
+                output_tokens = self.utils.count_tokens(cotResponseText)
 
-            memory_usage_after = self.memory_metrics.get_memory_usage()  # Memory after generation
-            # Log generation metrics
-            self.logger.log_operation(
-                operation="chain of thought",
-                tokens=input_tokens + output_tokens,
-                start_time=generation_start,
-                question=question,
-                context=context,
-                response=cotResponseText,
-                memory_usage_before=memory_usage_before,
-                memory_usage_after=memory_usage_after
-            )
-        except Exception as e:
-            cotResponseText = "" #Set cot response to empty string, to avoid errors
-            print(f"Error generating chain of thought: {e}")
+                memory_usage_after = self.memory_metrics.get_memory_usage()  # Memory after generation
+                # Log generation metrics
+                self.logger.log_operation(
+                    operation="chain of thought",
+                    tokens=input_tokens + output_tokens,
+                    start_time=generation_start,
+                    question=question,
+                    context=context,
+                    response=cotResponseText,
+                    memory_usage_before=memory_usage_before,
+                    memory_usage_after=memory_usage_after
+                )
+            except Exception as e:
+                cotResponseText = "" #Set cot response to empty string, to avoid errors
+                print(f"Error generating chain of thought: {e}")
 
         ############## Main prompt generation  
         try:
@@ -527,21 +886,10 @@ class SurgicalLLM:
             memory_usage_before = self.memory_metrics.get_memory_usage()
 
             # Get dynamic parameters based on intent - increased limits for complete responses
-            if intent_data.get('intent') == 'quick_answer':
-                max_tokens, temperature = 800, 0.1
-            elif intent_data.get('intent') == 'emergency':
-                max_tokens, temperature = 1000, 0.2
-            elif intent_data.get('intent') == 'specific_info' and intent_data.get('focus_area') in ['treatment', 'surgical_plan', 'medications']:
-                max_tokens, temperature = 1500, 0.2  # Increased for detailed treatment plans
-            elif intent_data.get('intent') == 'follow_up':
-                max_tokens, temperature = 1200, 0.2  # Increased for follow-up context
-            elif intent_data.get('urgency') == 'high':
-                max_tokens, temperature = 1000, 0.2
-            else:
-                max_tokens, temperature = 1200, 0.3  # Default increased for comprehensive responses
+            max_tokens, temperature = _generation_params(intent_data)
             
             # Count tokens and generate
-            input_tokens = self.utils.count_tokens(str(mainMessages))
+            input_tokens = self.utils.count_message_tokens(mainMessages)
             
             # Truncate input if too long (Llama 3.3 has ~8k context window, leave room for response)
             max_input_tokens = 6000  # Leave room for response tokens
@@ -551,63 +899,56 @@ class SurgicalLLM:
                 if len(mainMessages) > 1:
                     # Keep system message and user question, truncate middle content
                     truncated_context = context[:2000] + "...[truncated for length]"
-                    mainMessages = Prompts.build_prompt(
-                        prompt_type="main", 
-                        history=history_text[:1000] if history_text else "", 
-                        context=truncated_context, 
-                        question=question, 
-                        intent_data=intent_data,
-                        cot=cotResponseText[:1000] if cotResponseText else "",
-                        use_filtered_cot=use_filtered_cot
-                    )
-                    input_tokens = self.utils.count_tokens(str(mainMessages))
-                    print(f"Truncated to {input_tokens} tokens")
-            
-            # Make LLM request with AGGRESSIVE retry logic - NEVER GIVE UP
-            max_retries = 5
-            base_delay = 2
-            response = None
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"[DEBUG] Making main LLM request to {Config.MODEL_NAME} (attempt {attempt + 1}/{max_retries})")
-                    print(f"[DEBUG] Request parameters: max_tokens={max_tokens}, temperature={temperature}")
-                    
-                    response = self.client.chat_completion(
-                        messages=mainMessages,
-                        max_tokens=max_tokens,
-                        temperature=temperature,
-                        top_p=0.9,
-                        stream=False,  # Disable streaming for faster processing
-                    )
-                    print(f"[DEBUG] Main LLM request completed successfully on attempt {attempt + 1}")
-                    break  # Success - exit retry loop
-                    
-                except Exception as e:
-                    error_type = type(e).__name__
-                    print(f"[ERROR] Main LLM request failed on attempt {attempt + 1}: {str(e)}")
-                    print(f"[ERROR] Error type: {error_type}")
-                    
-                    if attempt < max_retries - 1:  # Not the last attempt
-                        delay = base_delay * (2 ** attempt)  # Exponential backoff
-                        print(f"[RETRY] Retrying in {delay} seconds... (attempt {attempt + 2}/{max_retries})")
-                        time.sleep(delay)
-                        continue
+                    # The system prompt doesn't change, so shorten the user message in place
+                    user_content = mainMessages[-1]["content"]
+                    shortened_in_place = True
+                    for full_text, truncated_text in (
+                        (context, truncated_context),
+                        (history_text, history_text[:1000]),
+                        (cotResponseText, cotResponseText[:1000]),
+                    ):
+                        if len(full_text) > len(truncated_text):
+                            if full_text not in user_content:
+                                shortened_in_place = False
+                                break
+                            user_content = user_content.replace(full_text, truncated_text, 1)
+                    if shortened_in_place:
+                        mainMessages[-1]["content"] = user_content
                     else:
-                        # Last attempt failed - this should NEVER happen in production
-                        print(f"[CRITICAL ERROR] All {max_retries} attempts failed. This system MUST work!")
-                        import traceback
-                        traceback.print_exc()
-                        raise Exception(f"Hugging Face API failed after {max_retries} attempts. System must be operational at all costs. Error: {str(e)}")
+                        # A part went into the prompt in another form; rebuild it from the truncated parts
+                        mainMessages = Prompts.build_prompt(
+                            prompt_type="main",
+                            history=history_text[:1000] if history_text else "",
+                            context=truncated_context,
+                            question=question,
+                            intent_data=intent_data,
+                            cot=cotResponseText[:1000] if cotResponseText else "",
+                            use_filtered_cot=use_filtered_cot
+                        )
+                    input_tokens = self.utils.count_message_tokens(mainMessages)
+                    print(f"Truncated to {input_tokens} tokens")
+                    if input_tokens > max_input_tokens:
+                        print(f"Warning: prompt is still {input_tokens} tokens after truncation (budget {max_input_tokens})")
             
-            if not response:
-                raise Exception("Failed to get response from Hugging Face API after all retry attempts")
+            # Make LLM request, retrying transient failures with jittered exponential backoff
+            log.debug("Making main LLM request to %s (max_tokens=%d, temperature=%s)", Config.MODEL_NAME, max_tokens, temperature)
+            try:
+                # Stream so the caller can show the answer while it is still being generated
+                responseText = self._stream_completion_with_retry(
+                    max_attempts=5,
+                    on_token=on_token,
+                    messages=mainMessages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=0.9,
+                )
+            except Exception as e:
+                _error_log.exception("All main LLM request attempts failed", e)
+                raise Exception(f"Hugging Face API failed after 5 attempts. Error: {str(e)}")
             
-            if response and response.choices and len(response.choices) > 0:
-                responseText = response.choices[0].message.content
-                output_tokens = self.utils.count_tokens(responseText)
-            else:
+            if not responseText:
                 return "Error: Invalid response from LLM", [], heading, {"intent": "error", "urgency": "low"}
+            output_tokens = self.utils.count_tokens(responseText)
 
             # Process and return response
             cleaned_response = self.utils.clean_response(responseText).rstrip()
@@ -627,7 +968,7 @@ class SurgicalLLM:
                 response=cleaned_response,
                 memory_usage_before=memory_usage_before,
                 memory_usage_after=memory_usage_after,
-                intent=intent_data.get("intent", "unknown")
+                intent=intent if intent is not None else "unknown"
             )
 
             # Log total processing time
@@ -642,11 +983,13 @@ class SurgicalLLM:
 
             # Return response with intent metadata
             response_metadata = {
-                "intent": intent_data.get("intent"),
+                "intent": intent,
                 "focus_area": intent_data.get("focus_area"),
                 "urgency": intent_data.get("urgency"),
                 "main_condition": intent_data.get("main_condition", "")
             }
+            if query_vector is not None:
+                self.response_cache.add(query_vector, (cleaned_response, source_links, response_metadata), tag=response_tag)
             
             return cleaned_response, source_links, heading, response_metadata
 
@@ -658,6 +1001,41 @@ class SurgicalLLM:
                 pass
             return f"An error occurred: {str(e)}", [], heading, {"intent": "error", "urgency": "low", "main_condition": "", "focus_area": ""}
 
+    def QA_stream(self, question: str, memory, system_prefix: Optional[dict] = None,
+                  document: Optional[str] = None):
+        """
+        Run `QA` on a worker thread and yield its output as it is produced.
+
+        Args:
+            question: User's input question
+            memory: Conversation memory object
+            system_prefix: Optional system message; see `QA`
+            document: Optional uploaded document text; see `QA`
+
+        Yields:
+            ("token", text) for each raw answer fragment as it streams in, then
+            ("result", (answer, sources, heading, metadata)) once `QA` returns.
+            The final answer is cleaned, so it can differ from the joined fragments.
+        """
+        events = queue.SimpleQueue()
+
+        def run():
+            try:
+                result = self.QA(question, memory, on_token=lambda token: events.put(("token", token)),
+                                 system_prefix=system_prefix, document=document)
+                events.put(("result", result))
+            except Exception as e:
+                events.put(("error", e))
+
+        threading.Thread(target=run, name="qa-stream", daemon=True).start()
+        while True:
+            kind, payload = events.get()
+            if kind == "error":
+                raise payload
+            yield kind, payload
+            if kind == "result":
+                return
+
 
 if __name__ == "__main__":
     llm = SurgicalLLM()
\ No newline at end of file
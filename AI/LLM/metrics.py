@@ -7,12 +7,19 @@ Classes:
     MemoryMetrics: Handles logic for memory utilization metrics.
 """
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from textstat import flesch_reading_ease
-from typing import Dict
+from typing import Dict, List
 import psutil
+import hashlib
 import os
+import threading
 import numpy as np
 
+from .config import Config
+
 # Import heavy dependencies only when needed
 try:
     from sentence_transformers import SentenceTransformer
@@ -28,45 +35,76 @@ except ImportError:
     spacy = None
     SPACY_AVAILABLE = False
 
-try:
-    from sklearn.metrics.pairwise import cosine_similarity
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    cosine_similarity = None
-    SKLEARN_AVAILABLE = False
+# Number of distinct contexts whose entities each calculator remembers
+CONTEXT_ENTITY_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=1)
+def _get_sentence_model():
+    """
+    Load MiniLM for the metrics once per process, preferring its INT8-quantized ONNX export.
+
+    The metrics are quality estimates, so dynamic INT8 quantization's small accuracy
+    cost is acceptable; falls back to the PyTorch FP32 model if ONNX can't be used.
+    """
+    onnx_file = Config.METRICS_ONNX_FILE
+    if onnx_file:
+        try:
+            return SentenceTransformer('all-MiniLM-L6-v2', backend="onnx", model_kwargs={"file_name": onnx_file})
+        except Exception as e:
+            print(f"Warning: Could not load ONNX SentenceTransformer model ({onnx_file}), falling back to PyTorch: {e}")
+    try:
+        return SentenceTransformer('all-MiniLM-L6-v2')
+    except Exception as e:
+        print(f"Warning: Could not load SentenceTransformer model: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def _get_spacy():
+    """
+    Load the spaCy pipeline once per process.
+
+    Only `.ents` (ner) and `.sents` (parser) are read, so the tagger, attribute
+    ruler and lemmatizer are left out.
+    """
+    try:
+        return spacy.load('en_core_web_sm', disable=['tagger', 'attribute_ruler', 'lemmatizer'])
+    except Exception as e:
+        print(f"Warning: Could not load spaCy model: {e}")
+        return None
+
 
 class ResponseMetricsCalculator:
     """
     Calculate various quality metrics for generated responses.
 
     Attributes:
-        sentence_model: SentenceTransformer model for semantic similarity
-        nlp: spaCy model for NLP tasks
+        sentence_model: SentenceTransformer model for semantic similarity (shared per process)
+        nlp: spaCy model for NLP tasks (shared per process)
     """
 
     def __init__(self):
-        """Initialize the metrics calculator with required models."""
+        """Initialize the metrics calculator with the shared models."""
         self.sentence_model = None
         self.nlp = None
         
         if SENTENCE_TRANSFORMERS_AVAILABLE:
-            try:
-                self.sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-            except Exception as e:
-                print(f"Warning: Could not load SentenceTransformer model: {e}")
-                self.sentence_model = None
+            self.sentence_model = _get_sentence_model()
         else:
             print("Warning: SentenceTransformers not available")
             
         if SPACY_AVAILABLE:
-            try:
-                self.nlp = spacy.load('en_core_web_sm')
-            except Exception as e:
-                print(f"Warning: Could not load spaCy model: {e}")
-                self.nlp = None
+            self.nlp = _get_spacy()
         else:
             print("Warning: spaCy not available")
 
+        # Runs the metrics of one get_all_metrics call that don't depend on the embeddings
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="metrics")
+        # Lowercased entities of recently seen contexts; RAG contexts repeat across turns
+        self._context_entities: "OrderedDict[bytes, frozenset]" = OrderedDict()
+        self._context_entities_lock = threading.Lock()
+
     def calculate_readability(self, text: str) -> float:
         """
         Calculate Flesch Reading Ease score for the text.
@@ -79,6 +117,65 @@ class ResponseMetricsCalculator:
         """
         return flesch_reading_ease(text)
 
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts in one batch as L2-normalized embeddings, so dot products are cosine similarities."""
+        return self.sentence_model.encode(
+            texts,
+            batch_size=32,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+    @staticmethod
+    def _coherence_from_embeddings(embeddings: np.ndarray) -> float:
+        """Coherence from normalized [question, context, response] embeddings."""
+        # Average of question-response and context-response similarities, as one matrix-vector product
+        return float((embeddings[:2] @ embeddings[2]).mean())
+
+    @staticmethod
+    def _redundancy_from_embeddings(embeddings: np.ndarray) -> float:
+        """Mean pairwise similarity between normalized sentence embeddings, excluding self-similarity."""
+        n = len(embeddings)
+        if n <= 1:
+            return 0.0
+        similarities = embeddings @ embeddings.T
+        # The matrix is symmetric, so the off-diagonal mean is the upper-triangle mean
+        return float((similarities.sum() - np.trace(similarities)) / (n * (n - 1)))
+
+    def _parse_response_and_context(self, response: str, context: str):
+        """
+        Parse the response with spaCy and get the context's lowercased entities.
+
+        The context is only parsed if its entities aren't cached; otherwise both
+        texts go through a single nlp.pipe call.
+
+        Returns:
+            Tuple of (response Doc, frozenset of context entities)
+        """
+        key = hashlib.blake2b(context.encode(), digest_size=16).digest()
+        with self._context_entities_lock:
+            context_ents = self._context_entities.get(key)
+            if context_ents is not None:
+                self._context_entities.move_to_end(key)
+        if context_ents is not None:
+            return self.nlp(response), context_ents
+
+        response_doc, context_doc = self.nlp.pipe([response, context], batch_size=2)
+        context_ents = frozenset(ent.text.lower() for ent in context_doc.ents)
+        with self._context_entities_lock:
+            self._context_entities[key] = context_ents
+            if len(self._context_entities) > CONTEXT_ENTITY_CACHE_SIZE:
+                self._context_entities.popitem(last=False)
+        return response_doc, context_ents
+
+    @staticmethod
+    def _hallucination_from_entities(response_doc, context_ents: frozenset) -> float:
+        """Share of the response's named entities that do not appear in the context."""
+        response_ents = {ent.text.lower() for ent in response_doc.ents}
+        if not response_ents:
+            return 0.0
+        return len(response_ents - context_ents) / len(response_ents)
+
     def calculate_coherence(self, question: str, context: str, response: str) -> float:
         """
         Calculate semantic coherence between question, context, and response.
@@ -91,26 +188,16 @@ class ResponseMetricsCalculator:
         Returns:
             float: Coherence score (0-1, higher is more coherent)
         """
-        if self.sentence_model is None or not SKLEARN_AVAILABLE:
-            print("Warning: SentenceTransformer model or sklearn not available, returning default coherence score")
+        if self.sentence_model is None:
+            print("Warning: SentenceTransformer model not available, returning default coherence score")
             return 0.5
             
         try:
-            # Encode texts
-            embeddings = self.sentence_model.encode([question, context, response])
-
-            # Calculate pairwise similarities
-            similarities = cosine_similarity(embeddings)
-
-            # Average of question-response and context-response similarities
-            q_r_similarity = similarities[0][2]
-            c_r_similarity = similarities[1][2]
+            return self._coherence_from_embeddings(self._encode([question, context, response]))
         except Exception as e:
             print(f"Warning: Error calculating coherence: {e}")
             return 0.5
 
-        return (q_r_similarity + c_r_similarity) / 2
-
     def calculate_hallucination_rate(self, response: str, context: str) -> float:
         """
         Estimate hallucination rate by comparing entities and facts in response vs context.
@@ -127,29 +214,14 @@ class ResponseMetricsCalculator:
             return 0.1
             
         try:
-            # Process texts
-            response_doc = self.nlp(response)
-            context_doc = self.nlp(context)
-
-            # Extract named entities
-            response_ents = set([ent.text.lower() for ent in response_doc.ents])
-            context_ents = set([ent.text.lower() for ent in context_doc.ents])
-
-            # Calculate entity overlap
-            if not response_ents:
-                return 0.0
-
-            unsupported_ents = response_ents - context_ents
-            hallucination_rate = len(unsupported_ents) / len(response_ents)
-
-            return hallucination_rate
+            return self._hallucination_from_entities(*self._parse_response_and_context(response, context))
         except Exception as e:
             print(f"Warning: Error calculating hallucination rate: {e}")
             return 0.1
 
     def calculate_redundancy_rate(self, text: str) -> float:
         """
-        Calculate redundancy rate using n-gram overlap.
+        Calculate redundancy rate as the mean pairwise similarity of the text's sentences.
 
         Args:
             text: Input text to analyze
@@ -157,44 +229,28 @@ class ResponseMetricsCalculator:
         Returns:
             float: Redundancy rate (0-1, lower is better)
         """
-        if self.nlp is None or self.sentence_model is None or not SKLEARN_AVAILABLE:
+        if self.nlp is None or self.sentence_model is None:
             print("Warning: Required models not available for redundancy calculation, returning default")
             return 0.1
             
         try:
-            # Process text
-            doc = self.nlp(text)
-            sentences = [sent.text.lower() for sent in doc.sents]
-
+            sentences = [sent.text.lower() for sent in self.nlp(text).sents]
             if len(sentences) <= 1:
                 return 0.0
-
-            # Calculate sentence embeddings
-            embeddings = self.sentence_model.encode(sentences)
-
-            # Calculate pairwise similarities between sentences
-            similarities = cosine_similarity(embeddings)
+            return self._redundancy_from_embeddings(self._encode(sentences))
         except Exception as e:
             print(f"Warning: Error calculating redundancy: {e}")
             return 0.1
 
-        # Calculate average similarity excluding self-similarity
-        n = len(sentences)
-        total_similarity = 0
-        count = 0
-
-        for i in range(n):
-            for j in range(i + 1, n):
-                total_similarity += similarities[i][j]
-                count += 1
-
-        redundancy_rate = total_similarity / count if count > 0 else 0
-        return redundancy_rate
-
     def get_all_metrics(self, question: str, context: str, response: str) -> Dict[str, float]:
         """
         Calculate all response quality metrics.
 
+        The response and (unless its entities are cached) the context are parsed in
+        one spaCy pipe call, and every text the metrics need (question, context,
+        response and the response's sentences) is embedded in a single encode call,
+        while readability and hallucination are computed on a small thread pool.
+
         Args:
             question: Original question
             context: Retrieved context
@@ -203,11 +259,33 @@ class ResponseMetricsCalculator:
         Returns:
             Dict containing all calculated metrics
         """
+        if self.nlp is None or self.sentence_model is None:
+            return {
+                'readability_score': self.calculate_readability(response),
+                'coherence_score': self.calculate_coherence(question, context, response),
+                'hallucination_rate': self.calculate_hallucination_rate(response, context),
+                'redundancy_rate': self.calculate_redundancy_rate(response)
+            }
+
+        # Readability (pure Python) and entity matching overlap with the encode call
+        readability_future = self._pool.submit(self.calculate_readability, response)
+        coherence, hallucination, redundancy = 0.5, 0.1, 0.1
+        try:
+            response_doc, context_ents = self._parse_response_and_context(response, context)
+            hallucination_future = self._pool.submit(self._hallucination_from_entities, response_doc, context_ents)
+            sentences = [sent.text.lower() for sent in response_doc.sents]
+            embeddings = self._encode([question, context, response] + sentences)
+            coherence = self._coherence_from_embeddings(embeddings[:3])
+            redundancy = self._redundancy_from_embeddings(embeddings[3:])
+            hallucination = hallucination_future.result()
+        except Exception as e:
+            print(f"Warning: Error calculating response metrics: {e}")
+
         return {
-            'readability_score': self.calculate_readability(response),
-            'coherence_score': self.calculate_coherence(question, context, response),
-            'hallucination_rate': self.calculate_hallucination_rate(response, context),
-            'redundancy_rate': self.calculate_redundancy_rate(response)
+            'readability_score': readability_future.result(),
+            'coherence_score': coherence,
+            'hallucination_rate': hallucination,
+            'redundancy_rate': redundancy
         }
 
 
@@ -221,7 +299,17 @@ class MemoryMetrics:
         self.process = psutil.Process(os.getpid())
         self.vectordb_path = vectordb_path
         self.total_embedding_size = 0
+        self.total_embeddings_recorded = 0
         self.BYTES_TO_KB = 1024
+        # On Linux, RSS is read straight from /proc/self/statm instead of parsing it via psutil
+        self._statm_fd = None
+        try:
+            self._statm_fd = os.open('/proc/self/statm', os.O_RDONLY)
+            self._page_kb = os.sysconf('SC_PAGE_SIZE') / self.BYTES_TO_KB
+        except (OSError, AttributeError, ValueError):
+            self._statm_fd = None
+        # Request threads record embeddings concurrently
+        self._lock = threading.Lock()
 
     def get_cpu_utilization(self) -> float:
         """Get the current CPU utilization as a percentage."""
@@ -229,11 +317,21 @@ class MemoryMetrics:
 
     def get_memory_usage(self) -> float:  # Return KB
         """Get the current memory usage in kilobytes."""
+        if self._statm_fd is not None:
+            # pread has no shared file offset, so concurrent callers can't interfere
+            rss_pages = int(os.pread(self._statm_fd, 128, 0).split()[1])
+            return rss_pages * self._page_kb
         return self.process.memory_info().rss / self.BYTES_TO_KB  # Resident Set Size (RSS) in KB
 
     def record_embedding_size(self, embedding: np.ndarray) -> None:
         """Record the size of an embedding."""
-        self.total_embedding_size += embedding.nbytes
+        self.record_embedding_batch(np.atleast_2d(embedding))
+
+    def record_embedding_batch(self, embeddings: np.ndarray) -> None:
+        """Record the size of a (N, D) array of embeddings in one update."""
+        with self._lock:
+            self.total_embedding_size += embeddings.nbytes
+            self.total_embeddings_recorded += embeddings.shape[0]
 
     def get_total_embedding_size(self) -> float: # Return KB
         """Return the total size of embeddings generated in KB."""
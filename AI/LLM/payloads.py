@@ -0,0 +1,146 @@
+"""
+Typed request/response payloads for the chat endpoints.
+
+With msgspec installed, request bodies are decoded straight into `ChatRequest`
+structs (type-checked, no intermediate dict) and responses are encoded from
+`ChatResponse` structs. Without it, the same classes are slotted dataclasses
+and the stdlib json module is used.
+
+Classes:
+    ChatRequest: Body of /api/chat and /api/chat/stream
+    ChatResponse: `data` payload of a chat answer
+    PayloadError: Raised when a request body can't be decoded
+
+Functions:
+    decode_chat_request: Decode a raw request body into a ChatRequest
+    encode: Serialize a payload (structs, dicts, lists) to JSON bytes
+"""
+
+import json
+from dataclasses import asdict, dataclass, fields, is_dataclass
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    msgspec = None
+    MSGSPEC_AVAILABLE = False
+
+
+class PayloadError(ValueError):
+    """Request body is not valid JSON or doesn't match the expected payload."""
+
+
+if MSGSPEC_AVAILABLE:
+    class ChatRequest(msgspec.Struct, frozen=True):
+        """Chat request body; unknown fields are ignored."""
+        message: str
+        conversation_id: Optional[str] = None
+        history: Optional[List[Dict[str, Any]]] = None
+        ocr_content: Optional[str] = None
+        attachments: Optional[List[Any]] = None
+        system_prompt: Optional[str] = None
+        context: Any = None
+
+    class ChatResponse(msgspec.Struct, frozen=True, omit_defaults=True):
+        """Chat answer; `cached` is only emitted when true."""
+        response: str
+        heading: Optional[str]
+        sources: List[Any]
+        tokens_used: int
+        processing_time: float
+        cached: bool = False
+
+        def as_cached(self) -> "ChatResponse":
+            """Copy of this response marked as served from cache"""
+            return msgspec.structs.replace(self, cached=True)
+
+    _chat_request_decoder = msgspec.json.Decoder(ChatRequest)
+    _encoder = msgspec.json.Encoder()
+
+    def decode_chat_request(body: bytes) -> ChatRequest:
+        """
+        Decode a raw request body into a ChatRequest.
+
+        Args:
+            body: Raw JSON request body
+
+        Returns:
+            Decoded request
+
+        Raises:
+            PayloadError: If the body is not valid JSON or `message` is missing/mistyped
+        """
+        try:
+            return _chat_request_decoder.decode(body)
+        except msgspec.DecodeError as e:
+            raise PayloadError(str(e)) from e
+
+    def encode(obj: Any) -> bytes:
+        """Serialize a payload to JSON bytes"""
+        return _encoder.encode(obj)
+
+else:
+    @dataclass(frozen=True, slots=True)
+    class ChatRequest:
+        """Chat request body; unknown fields are ignored."""
+        message: str
+        conversation_id: Optional[str] = None
+        history: Optional[List[Dict[str, Any]]] = None
+        ocr_content: Optional[str] = None
+        attachments: Optional[List[Any]] = None
+        system_prompt: Optional[str] = None
+        context: Any = None
+
+    @dataclass(frozen=True, slots=True)
+    class ChatResponse:
+        """Chat answer; `cached` is only emitted when true."""
+        response: str
+        heading: Optional[str]
+        sources: List[Any]
+        tokens_used: int
+        processing_time: float
+        cached: bool = False
+
+        def as_cached(self) -> "ChatResponse":
+            """Copy of this response marked as served from cache"""
+            return ChatResponse(self.response, self.heading, self.sources,
+                                self.tokens_used, self.processing_time, cached=True)
+
+    _CHAT_REQUEST_FIELDS = frozenset(f.name for f in fields(ChatRequest))
+
+    def decode_chat_request(body: bytes) -> ChatRequest:
+        """
+        Decode a raw request body into a ChatRequest.
+
+        Args:
+            body: Raw JSON request body
+
+        Returns:
+            Decoded request
+
+        Raises:
+            PayloadError: If the body is not valid JSON or `message` is missing/mistyped
+        """
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise PayloadError(str(e)) from e
+        if not isinstance(data, dict):
+            raise PayloadError("Expected `object`")
+        if not isinstance(data.get('message'), str):
+            raise PayloadError("Expected `str` for `message`")
+        return ChatRequest(**{k: v for k, v in data.items() if k in _CHAT_REQUEST_FIELDS})
+
+    def _default(obj):
+        if is_dataclass(obj):
+            data = asdict(obj)
+            if isinstance(obj, ChatResponse) and not obj.cached:
+                del data['cached']
+            return data
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def encode(obj: Any) -> bytes:
+        """Serialize a payload to JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False).encode()
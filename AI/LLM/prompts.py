@@ -1,4 +1,6 @@
 # prompts.py
+import logging
+
 try:
     from transformers import AutoTokenizer
 except ImportError as e:
@@ -6,6 +8,8 @@ except ImportError as e:
     AutoTokenizer = None
 from .config import Config
 
+log = logging.getLogger(__name__)
+
 class Prompts:
 
     MAIN_PROMPT = """
@@ -509,6 +513,18 @@ class Prompts:
     @classmethod
     def build_prompt(cls, prompt_type: str, history: str = "", context: str = "", question: str = "", cot: str = "", intent_data: dict = None, use_filtered_cot: bool = False) -> list:
         """Construct the messages for LLM chat API."""
+        system_input, user_input = cls._build_prompt_text(prompt_type, history, context, question, cot, intent_data, use_filtered_cot)
+
+        messages = [
+            {"role": "system", "content": system_input},
+            {"role": "user", "content": user_input},
+        ]
+
+        return messages
+
+    @classmethod
+    def _build_prompt_text(cls, prompt_type: str, history: str, context: str, question: str, cot: str, intent_data: dict, use_filtered_cot: bool) -> tuple:
+        """Return the (system, user) message contents for a prompt type."""
 
         if prompt_type == "intent_detection":
             system_input = cls.INTENT_DETECTION_PROMPT
@@ -521,13 +537,12 @@ class Prompts:
                            question_type != "general")
             
             if should_filter:
-                print(f"[DEBUG] Using FILTERED prompt for question type: {question_type}")
+                log.debug("Using FILTERED prompt for question type: %s", question_type)
             
             if intent_data:
                 style_data = cls.get_response_style_instructions(intent_data)
-                print(f"[DEBUG PROMPT] Style data: {style_data}")
-                print(f"[DEBUG PROMPT] Response style: {style_data['response_style']}")
-                print(f"[DEBUG PROMPT] Focus instructions: {style_data['focus_instructions'][:100]}...")
+                log.debug("Response style: %s", style_data['response_style'])
+                log.debug("Focus instructions: %.100s...", style_data['focus_instructions'])
                 try:
                     # Use filtered prompt if appropriate
                     if should_filter:
@@ -551,8 +566,7 @@ class Prompts:
                             response_style=style_data["response_style"],
                             focus_instructions=style_data["focus_instructions"]
                         )
-                    print(f"[DEBUG PROMPT] System prompt generated successfully, length: {len(system_input)}")
-                    print(f"[DEBUG PROMPT] System prompt preview: {system_input[:500]}...")
+                    log.debug("System prompt generated, length %d: %.500s...", len(system_input), system_input)
                 except Exception as e:
                     print(f"[DEBUG PROMPT] Error formatting prompt: {e}")
                     system_input = cls.MAIN_PROMPT
@@ -585,9 +599,4 @@ class Prompts:
         else:
             raise ValueError(f"Unknown prompt type: {prompt_type}")
 
-        messages = [
-            {"role": "system", "content": system_input},
-            {"role": "user", "content": user_input},
-        ]
-
-        return messages
\ No newline at end of file
+        return system_input, user_input
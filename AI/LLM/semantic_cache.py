@@ -0,0 +1,244 @@
+"""
+Similarity cache keyed by text embeddings.
+
+Classes:
+    SemanticCache: Fixed-capacity cache that returns a stored value when a new
+                   embedding is close enough (cosine) to a cached one.
+
+Functions:
+    versioned_path: Cache file path tied to the data the cached values came from.
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+
+def versioned_path(path: str, *versions) -> str:
+    """
+    Cache file path that changes whenever the data behind the cached values does.
+
+    The versions (e.g. the knowledge base's ingest stamp and size) are hashed into
+    the file name, so a cache written against older data is never loaded; files
+    left behind by earlier versions of the same cache are removed.
+
+    Args:
+        path: Unversioned cache path, e.g. ".../retrieval_cache.pkl"
+        versions: Values the cached results depend on
+
+    Returns:
+        Path such as ".../retrieval_cache-1a2b3c4d5e6f7a8b.pkl"
+    """
+    root, ext = os.path.splitext(path)
+    digest = hashlib.blake2b("\0".join(map(str, versions)).encode(), digest_size=8).hexdigest()
+    current = f"{root}-{digest}{ext}"
+    for stale in glob.glob(f"{glob.escape(root)}*{ext}"):
+        if stale != current:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return current
+
+
+class SemanticCache:
+    """
+    Fixed-capacity cache of values keyed by unit-normalized embeddings.
+
+    Lookups are an exact inner-product search over every cached key (a single
+    matrix-vector product); when full, the least recently used entry is replaced.
+    Entries can carry a tag (e.g. a digest of the conversation history), in which
+    case a lookup only matches entries with the same tag. With a `ttl`, entries stop
+    matching that many seconds after they were added.
+
+    With a `path`, the cache is loaded from it on creation and saved back every
+    `save_every` adds, on a background thread so the adding request isn't held up.
+    Each save atomically replaces the file with this instance's complete cache.
+    Several processes (gunicorn workers) may share a path: none ever sees a partial
+    file, but the last one to save wins, and the others' entries are only picked up
+    when a process next starts.
+
+    Attributes:
+        capacity: Maximum number of cached entries
+        threshold: Minimum cosine similarity for a lookup to count as a hit
+        path: Optional pickle file the cache is loaded from and saved to
+        ttl: Optional lifetime of an entry in seconds
+    """
+
+    def __init__(self, capacity: int = 1000, threshold: float = 0.97,
+                 path: Optional[str] = None, save_every: int = 50, ttl: Optional[float] = None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.path = path
+        self.ttl = ttl
+        self.save_every = save_every
+        self._keys = None  # (capacity, dim) float32, allocated on first add
+        self._values = [None] * capacity
+        self._tags = np.full(capacity, None, dtype=object)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        # Wall-clock time each entry was added, so expiry carries over a save and load
+        self._added_at = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+        self._tick = 0
+        self._unsaved = 0
+        self._saving = False
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        """Return the embedding as a unit-length float32 vector (float32 input is not copied before scaling)."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding, tag: Optional[str] = None) -> Optional[Any]:
+        """
+        Find the cached value whose key is most similar to the embedding.
+
+        Args:
+            embedding: Query embedding (need not be normalized)
+            tag: Only entries added with this tag are considered
+
+        Returns:
+            The cached value if its similarity is at least `threshold`, else None
+        """
+        query = self.normalize(embedding)
+        with self._lock:
+            if self._size == 0 or self._keys.shape[1] != query.shape[0]:
+                return None
+            scores = self._keys[:self._size] @ query
+            scores[self._tags[:self._size] != tag] = -np.inf
+            if self.ttl is not None:
+                scores[self._added_at[:self._size] < time.time() - self.ttl] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._tick += 1
+            self._last_used[best] = self._tick
+            return self._values[best]
+
+    def add(self, embedding, value: Any, tag: Optional[str] = None) -> None:
+        """
+        Cache a value under the embedding, evicting the least recently used entry if full.
+
+        Args:
+            embedding: Key embedding (need not be normalized)
+            value: Value returned by later lookups that match this key
+            tag: Tag that later lookups must pass to match this entry
+        """
+        key = self.normalize(embedding)
+        with self._lock:
+            if self._keys is None or self._keys.shape[1] != key.shape[0]:
+                self._keys = np.zeros((self.capacity, key.shape[0]), dtype=np.float32)
+                self._values = [None] * self.capacity
+                self._tags[:] = None
+                self._size = 0
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._keys[slot] = key
+            self._values[slot] = value
+            self._tags[slot] = tag
+            self._added_at[slot] = time.time()
+            self._tick += 1
+            self._last_used[slot] = self._tick
+            self._unsaved += 1
+            should_save = self.path is not None and self._unsaved >= self.save_every and not self._saving
+            if should_save:
+                self._saving = True
+
+        if should_save:
+            threading.Thread(target=self._save_in_background, name="semantic-cache-save", daemon=True).start()
+
+    def _save_in_background(self) -> None:
+        try:
+            self.save()
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def save(self) -> None:
+        """Persist the cache to `path`."""
+        if not self.path:
+            return
+        with self._lock:
+            state = {
+                'keys': None if self._keys is None else self._keys[:self._size].copy(),
+                'values': self._values[:self._size],
+                'tags': self._tags[:self._size].tolist(),
+                'last_used': self._last_used[:self._size].copy(),
+                'added_at': self._added_at[:self._size].copy(),
+            }
+            self._unsaved = 0
+        tmp_path = None
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Unique temp file per save, so concurrent savers (threads or worker processes) never
+            # write into the same file; os.replace then swaps a complete pickle into place
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.path)}.", suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+        except Exception as e:
+            print(f"Warning: Could not save semantic cache to {self.path}: {e}")
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def load(self) -> None:
+        """Load a cache previously written by `save`."""
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load semantic cache from {self.path}: {e}")
+            return
+
+        keys = state.get('keys')
+        if keys is None or len(keys) == 0:
+            return
+        added_at = state.get('added_at')
+        if added_at is None:
+            added_at = np.full(len(keys), time.time())
+        # Keep the most recently used unexpired entries if the file holds more than we can
+        keep = np.argsort(state['last_used'])
+        if self.ttl is not None:
+            keep = keep[added_at[keep] >= time.time() - self.ttl]
+        keep = keep[-self.capacity:]
+        if len(keep) == 0:
+            return
+        with self._lock:
+            self._keys = np.zeros((self.capacity, keys.shape[1]), dtype=np.float32)
+            self._values = [None] * self.capacity
+            self._size = len(keep)
+            self._keys[:self._size] = keys[keep]
+            tags = state.get('tags') or [None] * len(keys)
+            self._tags[:] = None
+            self._added_at[:] = 0
+            self._added_at[:self._size] = added_at[keep]
+            for slot, i in enumerate(keep):
+                self._values[slot] = state['values'][i]
+                self._tags[slot] = tags[i]
+            self._last_used[:] = 0
+            self._last_used[:self._size] = np.arange(1, self._size + 1)
+            self._tick = self._size
+
+    def __len__(self) -> int:
+        return self._size
@@ -1,11 +1,18 @@
 # suggestions.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from .main import SurgicalLLM
 from .prompts import Prompts
 from .config import Config
+from .exact_cache import ExactCache
+
+log = logging.getLogger(__name__)
 
 # Global variable for lazy initialization
 _llm = None
+# Batches of suggestions keyed by num_suggestions; shared by concurrent request threads
+_suggestion_cache = ExactCache(capacity=16, ttl=Config.SUGGESTION_CACHE_TTL)
 
 def _get_llm():
     """Get or create LLM instance with lazy initialization."""
@@ -18,25 +25,39 @@ def _get_llm():
             raise e
     return _llm
 
+def _generate_suggestion(llm, seed: int) -> str:
+    """Generate one suggestion; the seed is the only thing that varies between calls."""
+    suggestion_messages = Prompts.build_prompt(prompt_type="suggestion")
+    response = llm.client.chat_completion(
+        messages=suggestion_messages,
+        max_tokens=20,
+        temperature=0.7,
+        seed=seed  # Pass the seed parameter
+    )
+    return response.choices[0].message.content.strip().replace("\n", "")
+
 def generate_suggestions(num_suggestions: int = 5) -> List[str]:
-    """Generates a list of surgical question suggestions using the LLM."""
+    """
+    Generates a list of surgical question suggestions using the LLM.
+
+    The prompt never changes, so a batch is reused for Config.SUGGESTION_CACHE_TTL
+    seconds; on a miss the per-seed requests are sent concurrently.
+    """
+    cache_key = ExactCache.key(num_suggestions)
+    cached = _suggestion_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
     try:
         llm = _get_llm()
         # Ensure LLM is fully initialized before using
         llm._ensure_initialized()
-        suggestions = []
-        for seed in range(num_suggestions):
-            suggestion_messages = Prompts.build_prompt(prompt_type="suggestion")
-            response = llm.client.chat_completion(
-                messages=suggestion_messages,
-                max_tokens=20,
-                temperature=0.7,
-                seed=seed  # Pass the seed parameter
-            )
-            suggestion = response.choices[0].message.content.strip().replace("\n", "")
-            suggestions.append(suggestion)
-        print(suggestions)
+        if num_suggestions <= 0:
+            return []
+        with ThreadPoolExecutor(max_workers=num_suggestions) as executor:
+            suggestions = list(executor.map(lambda seed: _generate_suggestion(llm, seed), range(num_suggestions)))
+        log.debug("Generated suggestions: %s", suggestions)
+        _suggestion_cache.set(cache_key, tuple(suggestions))
         return suggestions
     except Exception as e:
         print(f"Error generating suggestions: {e}")
-        return []
\ No newline at end of file
+        return []
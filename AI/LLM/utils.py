@@ -3,17 +3,59 @@ Utility functions for token management and response processing.
 
 Classes:
     Utils: Provides token counting and response cleaning functionality.
+    PhraseMatcher: Finds which groups of keyword phrases occur in a text in one pass.
 """
 
 import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set
 from transformers import AutoTokenizer
 
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    ahocorasick = None
+    AHOCORASICK_AVAILABLE = False
+
+# Boilerplate phrases the LLM tends to prefix its answers with
+_FILLER_PHRASES_RE = re.compile(
+    r"(?i)(?:Please provide.?\.|Here['']s.?:|Let me explain:|According to the data:|In summary:|Explanation:"
+    r"|Clarification:|Here is my response:|AI Assistant:|Response:|Answer:|System:)"
+)
+
+# Prompt messages are counted in blocks split on blank lines (see Utils.count_message_tokens)
+_PARAGRAPH_SEPARATOR = "\n\n"
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(model_name: str):
+    """
+    Load a fast tokenizer once per model name, so every Utils instance shares it.
+
+    Args:
+        model_name: Name of the pretrained model to load tokenizer for
+
+    Returns:
+        The tokenizer, or None if neither it nor the fallback could be loaded
+    """
+    try:
+        return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer for {model_name}: {e}")
+        print("Using fallback tokenizer...")
+        try:
+            # Try a fallback tokenizer that's more compatible
+            return AutoTokenizer.from_pretrained("gpt2", use_fast=True)
+        except Exception as e2:
+            print(f"Warning: Could not load fallback tokenizer: {e2}")
+            return None
+
 class Utils:
     """
     A utility class for token management and text processing.
 
     Attributes:
-        tokenizer: Pretrained tokenizer from HuggingFace
+        tokenizer: Pretrained tokenizer from HuggingFace, shared by instances with the same model_name
         total_input_tokens: Cumulative count of input tokens
         total_output_tokens: Cumulative count of output tokens
     """
@@ -25,20 +67,11 @@ class Utils:
         Args:
             model_name: Name of the pretrained model to load tokenizer for
         """
-        try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        except Exception as e:
-            print(f"Warning: Could not load tokenizer for {model_name}: {e}")
-            print("Using fallback tokenizer...")
-            try:
-                # Try a fallback tokenizer that's more compatible
-                self.tokenizer = AutoTokenizer.from_pretrained("gpt2")
-            except Exception as e2:
-                print(f"Warning: Could not load fallback tokenizer: {e2}")
-                self.tokenizer = None
-        
+        self.tokenizer = _load_tokenizer(model_name)
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        # System prompts, history turns, documents and context repeat across calls and turns
+        self._count_tokens_cached = lru_cache(maxsize=4096)(self.count_tokens)
 
     def count_tokens(self, text: str) -> int:
         """
@@ -55,13 +88,38 @@ class Utils:
             return len(text) // 4
         
         try:
-            tokens = self.tokenizer.encode(text, return_tensors="pt")
-            return tokens.shape[1] # Return the number of tokens
+            # Plain id list from the Rust tokenizer; no tensor is needed just to count
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
         except Exception as e:
             print(f"Warning: Error counting tokens: {e}")
             # Fallback: approximate token count
             return len(text) // 4
 
+    def count_message_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Count tokens in a chat messages list.
+
+        Contents are counted paragraph by paragraph (split on blank lines), each
+        paragraph tokenized once and cached, plus a fixed per-message overhead for
+        the role and chat template markers. Prompts embed the conversation history,
+        so paragraphs that recur across turns (an uploaded document's OCR text,
+        earlier turns, template boilerplate) are only tokenized the first time,
+        even though the message as a whole is new on every turn.
+
+        Args:
+            messages: Chat messages as {"role": ..., "content": ...} dicts
+
+        Returns:
+            Approximate number of prompt tokens
+        """
+        count = self._count_tokens_cached
+        total = 4 * len(messages)
+        for message in messages:
+            paragraphs = message["content"].split(_PARAGRAPH_SEPARATOR)
+            # One token per blank-line separator
+            total += sum(count(paragraph) for paragraph in paragraphs) + len(paragraphs) - 1
+        return total
+
     def clean_response(self, response: str) -> str:
         """
         Clean and format LLM response text.
@@ -72,29 +130,82 @@ class Utils:
         Returns:
             Cleaned and formatted response text
         """
-        lines = response.splitlines()
-        cleaned_lines = []
+        result = []
+        append = result.append  # Bound once; this loop runs for every line of every response
+        strip_fillers = _FILLER_PHRASES_RE.sub
         previous_line_empty = True
-        
-        for line in lines:
-            cleaned_line = re.sub(r"(?i)(?:Please provide.?\.|Here['']s.?:|Let me explain:|According to the data:|In summary:|Explanation:|Clarification:|Here is my response:|AI Assistant:|Response:|Answer:|System:)", "", line).strip()
+
+        # Blank runs collapse to a single empty line; leading/trailing ones are stripped below
+        for line in response.splitlines():
+            cleaned_line = strip_fillers("", line).strip()
             if cleaned_line:
                 if previous_line_empty:
-                    cleaned_lines.append("")
+                    append("")
                     previous_line_empty = False
-                cleaned_lines.append(cleaned_line)
-            else:
-                if not previous_line_empty:
-                    previous_line_empty = True
-
-        result = []
-        blank_count = 0
-        for line in cleaned_lines:
-            if line == "":
-                blank_count += 1
+                append(cleaned_line)
             else:
-                blank_count = 0
-            if blank_count <= 1:
-                result.append(line)
+                previous_line_empty = True
 
         return "\n".join(result).strip()
+
+
+class PhraseMatcher:
+    """
+    Multi-pattern substring matcher over tagged groups of phrases.
+
+    Uses an Aho-Corasick automaton when pyahocorasick is installed, so the text
+    is scanned once regardless of how many phrases there are; otherwise falls
+    back to one compiled regex alternation per tag. Matching is plain substring
+    matching, the same as `phrase in text`.
+    """
+
+    def __init__(self, tagged_phrases: Dict[str, Iterable[str]]):
+        """
+        Build the matcher.
+
+        Args:
+            tagged_phrases: Mapping of tag -> phrases that should report that tag
+        """
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for tag, phrases in tagged_phrases.items():
+                for phrase in phrases:
+                    # A phrase may belong to several tags
+                    tags = self._automaton.get(phrase, frozenset())
+                    self._automaton.add_word(phrase, tags | {tag})
+            self._automaton.make_automaton()
+            self._patterns = None
+        else:
+            self._automaton = None
+            self._patterns = {
+                tag: re.compile("|".join(re.escape(phrase) for phrase in phrases))
+                for tag, phrases in tagged_phrases.items()
+            }
+
+    def hits(self, text: str) -> Set[str]:
+        """
+        Return the tags whose phrases occur in the text.
+
+        Args:
+            text: Text to scan (callers pass it already lowercased)
+
+        Returns:
+            Set of matching tags
+        """
+        if self._automaton is not None:
+            return {tag for _, tags in self._automaton.iter(text) for tag in tags}
+        return {tag for tag, pattern in self._patterns.items() if pattern.search(text)}
+
+    def matches_any(self, text: str) -> bool:
+        """
+        Return whether any phrase occurs in the text, stopping at the first match.
+
+        Args:
+            text: Text to scan (callers pass it already lowercased)
+
+        Returns:
+            True if at least one phrase occurs
+        """
+        if self._automaton is not None:
+            return next(self._automaton.iter(text), None) is not None
+        return any(pattern.search(text) for pattern in self._patterns.values())
@@ -1,23 +1,132 @@
 # llm_modules/validation.py
+import hashlib
 import json
+import logging
+import threading
 import time
+from collections import OrderedDict
+from typing import Optional, Set
 
-from .utils import Utils
+try:
+    import orjson
+    _json_loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+
+from .utils import Utils, PhraseMatcher
 from .config import Config
 from .prompts import Prompts
 from .logger import PerformanceLogger
 from .metrics import MemoryMetrics
+from .semantic_cache import SemanticCache
+
+log = logging.getLogger(__name__)
 
 class ValidationError(Exception):
     """Raised when question validation fails."""
     pass
 
+# Sexual misconduct patterns
+SEXUAL_MISCONDUCT_PATTERNS = [
+    "take advantage",
+    "advantage of",
+    "sedated patient",
+    "unconscious patient",
+    "exploit patient",
+    "inappropriate exam",
+    "sexual harassment",
+    "non-consensual",
+    "without consent",
+    "abuse patient"
+]
+
+# Other malicious patterns
+MALICIOUS_PATTERNS = [
+    "ignore instruction",
+    "bypass rule",
+    "show chain of thought",
+    "internal prompt",
+    "fake medical",
+    "forge report",
+    "overdose",
+    "worsen condition",
+    "prescription for",
+    "write me a prescription",
+    "show your prompt",
+    "reveal rule",
+    "toxic combination"
+]
+
+# Medical keywords that indicate high likelihood of medical relevance
+MEDICAL_KEYWORDS = [
+    'symptom', 'symptoms', 'pain', 'ache', 'hurt', 'surgery', 'surgical', 'operation',
+    'doctor', 'physician', 'hospital', 'clinic', 'treatment', 'medicine', 'medication',
+    'diagnosis', 'diagnose', 'disease', 'condition', 'illness', 'sick', 'health',
+    'infection', 'fever', 'headache', 'nausea', 'vomiting', 'bleeding', 'swelling',
+    'recovery', 'healing', 'wound', 'injury', 'fracture', 'broken', 'sprain',
+    'cancer', 'tumor', 'cyst', 'rash', 'allergic', 'allergy', 'chest pain',
+    'abdomen', 'stomach', 'liver', 'kidney', 'heart', 'lung', 'brain', 'spine',
+    'blood', 'pressure', 'diabetic', 'diabetes', 'hypertension', 'medication',
+    'prescription', 'dosage', 'side effect', 'complication', 'emergency',
+    'urgent', 'acute', 'chronic', 'patient', 'medical history'
+]
+
+# Temporal medical contexts that should be accepted
+TEMPORAL_MEDICAL = [
+    'days ago', 'weeks ago', 'months ago', 'years ago', 'yesterday', 'last week',
+    'last month', 'since', 'after', 'before', 'during', 'following', 'prior to',
+    'recently', 'lately', 'ongoing', 'persistent', 'recurring', 'intermittent'
+]
+
+HEALTH_INDICATORS = ['feel', 'feeling', 'experience', 'experiencing', 'having', 'been', 'was', 'got', 'developed']
+
+# Every keyword group checked against the question, matched in a single scan
+_QUESTION_MATCHER = PhraseMatcher({
+    "sexual_misconduct": SEXUAL_MISCONDUCT_PATTERNS,
+    "medical_staff": ["doctor", "physician", "medical"],
+    "misconduct_action": ["advantage", "exploit", "abuse", "inappropriate"],
+    "malicious": MALICIOUS_PATTERNS,
+    "medical": MEDICAL_KEYWORDS,
+    "temporal": TEMPORAL_MEDICAL,
+    "health_indicator": HEALTH_INDICATORS,
+})
+
+# The most common medical keywords, looked for in the history of short follow-up questions
+_HISTORY_MATCHER = PhraseMatcher({"medical": MEDICAL_KEYWORDS[:15]})
+
+
+INVALID_JSON_MESSAGE = "Invalid JSON response from LLM"
+
+
+# Exact (question, history) pairs whose verdicts are remembered by each Validator
+EXACT_CACHE_SIZE = 1024
+
+
+def _exact_key(question_lower: str, history_text: str) -> bytes:
+    """Exact-match cache key for a lowercased question and its conversation history."""
+    h = hashlib.blake2b(question_lower.encode(), digest_size=16, person=b"validate")
+    h.update(b"\0")
+    h.update((history_text or "").encode())
+    return h.digest()
+
+
+def history_digest(history_text: str) -> str:
+    """Short digest of the conversation history, used to tag semantic cache entries."""
+    return hashlib.blake2b((history_text or "").encode(), digest_size=8).hexdigest()
+
+
 class Validator:
-    def __init__(self, client, memory_metrics: MemoryMetrics, logger: PerformanceLogger):
+    def __init__(self, client, memory_metrics: MemoryMetrics, logger: PerformanceLogger,
+                 cache: Optional[SemanticCache] = None):
         self.client = client
         self.utils = Utils(Config.MODEL_NAME)
         self.memory_metrics = memory_metrics
         self.logger = logger
+        # Verdicts for near-identical questions (with the same history) skip the LLM call
+        self.cache = cache
+        # Verdicts for exact repeats (resends, clicked suggestions), checked before any other work
+        self._exact_cache: "OrderedDict[bytes, tuple[bool, str]]" = OrderedDict()
+        self._exact_lock = threading.Lock()
 
     def summarize(self, question: str, history_text: str) -> str:
         """
@@ -50,73 +159,72 @@ class Validator:
         except Exception as e:
             raise ValidationError(f"Summarization error: {str(e)}") from e
 
-    def validate(self, question: str, history_text: str) -> tuple[bool, str]:
+    def validate(self, question: str, history_text: str, question_embedding=None) -> tuple[bool, str]:
         """
         Validate if a question is medically relevant using the LLM.
 
         Args:
             question: User's input question
             history_text: Formatted conversation history
+            question_embedding: Embedding of the question; enables the semantic cache
 
         Returns:
             Tuple containing:
                 - bool: Validation result (True if relevant)
                 - str: Validation message or explanation
         """
-        # Check for malicious patterns FIRST - before any LLM call
         question_lower = question.lower()
+        key = _exact_key(question_lower, history_text)
+        with self._exact_lock:
+            cached = self._exact_cache.get(key)
+            if cached is not None:
+                self._exact_cache.move_to_end(key)
+                return cached
+
+        result = self._validate(question, question_lower, history_text, question_embedding)
+        if result[1] != INVALID_JSON_MESSAGE:
+            with self._exact_lock:
+                self._exact_cache[key] = result
+                if len(self._exact_cache) > EXACT_CACHE_SIZE:
+                    self._exact_cache.popitem(last=False)
+        return result
+
+    def _validate(self, question: str, question_lower: str, history_text: str,
+                  question_embedding=None) -> tuple[bool, str]:
+        """Run the keyword checks, semantic cache and LLM validation; see `validate`."""
+        # Check for malicious patterns FIRST - before any LLM call (one scan finds every keyword group)
+        hits = _QUESTION_MATCHER.hits(question_lower)
         
-        # Sexual misconduct patterns - explicit detection
-        sexual_misconduct_patterns = [
-            "take advantage",
-            "advantage of",
-            "sedated patient",
-            "unconscious patient",
-            "exploit patient",
-            "inappropriate exam",
-            "sexual harassment",
-            "non-consensual",
-            "without consent",
-            "abuse patient"
-        ]
-        
-        # Check for sexual misconduct
-        for pattern in sexual_misconduct_patterns:
-            if pattern in question_lower:
-                # Check for combinations that are clearly malicious
-                if ("doctor" in question_lower or "physician" in question_lower or "medical" in question_lower):
-                    if any(word in question_lower for word in ["advantage", "exploit", "abuse", "inappropriate"]):
-                        return False, "I can't help with that request."
+        # Sexual misconduct involving medical staff - explicit detection
+        if {"sexual_misconduct", "medical_staff", "misconduct_action"} <= hits:
+            return False, "I can't help with that request."
         
         # Check for other malicious patterns
-        malicious_patterns = [
-            "ignore instruction",
-            "bypass rule",
-            "show chain of thought",
-            "internal prompt",
-            "fake medical",
-            "forge report",
-            "overdose",
-            "worsen condition",
-            "prescription for",
-            "write me a prescription",
-            "show your prompt",
-            "reveal rule",
-            "toxic combination"
-        ]
-        
-        for pattern in malicious_patterns:
-            if pattern in question_lower:
-                return False, "I can't help with that request."
+        if "malicious" in hits:
+            return False, "I can't help with that request."
         
         # Handle simple goodbye cases
-        if question.strip().lower() in ["bye", "goodbye", "exit", "quit"]:
+        if question_lower.strip() in ["bye", "goodbye", "exit", "quit"]:
             return False, "Goodbye! It was nice interacting with you. Feel free to return if you have more questions."
             
         # Pre-validate common medical patterns to reduce API calls
-        if self._is_likely_medical(question, history_text):
+        if self._is_likely_medical(question_lower, history_text, hits):
             return True, ""
-            
+
+        use_cache = self.cache is not None and question_embedding is not None
+        if use_cache:
+            tag = history_digest(history_text)
+            cached = self.cache.lookup(question_embedding, tag=tag)
+            if cached is not None:
+                return cached
+
+        result = self._validate_with_llm(question, history_text)
+        if use_cache and result[1] != INVALID_JSON_MESSAGE:
+            self.cache.add(question_embedding, result, tag=tag)
+        return result
+
+    def _validate_with_llm(self, question: str, history_text: str) -> tuple[bool, str]:
+        """Ask the LLM whether the question is relevant; see `validate`."""
         validation_messages = Prompts.build_prompt(prompt_type="validation", history=history_text, question=question)
         start_time = time.time()
         mem_before = self.memory_metrics.get_memory_usage()
@@ -137,14 +245,13 @@ class Validator:
                 },
             )
             response_text = response.choices[0].message.content
-            print("\nResponse: ", response_text)
-            response_json = json.loads(response_text)
-            print(response_json)
+            log.debug("Validation response: %s", response_text)
+            response_json = _json_loads(response_text)
             mem_after = self.memory_metrics.get_memory_usage()
             
             self.logger.log_operation(
                 operation="validation",
-                tokens=self.utils.count_tokens(str(validation_messages) + response_text),
+                tokens=self.utils.count_message_tokens(validation_messages) + self.utils.count_tokens(response_text),
                 start_time=start_time,
                 memory_usage_before=mem_before,
                 memory_usage_after=mem_after
@@ -162,60 +269,34 @@ class Validator:
         except json.JSONDecodeError as e:
             mem_after = self.memory_metrics.get_memory_usage()
             self.logger.log_operation("validation", is_error=True, memory_usage_before=mem_before, memory_usage_after=mem_after)
-            return False, "Invalid JSON response from LLM"
+            return False, INVALID_JSON_MESSAGE
         except Exception as e:
             mem_after = self.memory_metrics.get_memory_usage()
             self.logger.log_operation("validation", is_error=True, memory_usage_before=mem_before, memory_usage_after=mem_after)
             raise ValidationError(f"Validation error: {str(e)}") from e
     
-    def _is_likely_medical(self, question: str, history_text: str) -> bool:
+    def _is_likely_medical(self, question_lower: str, history_text: str, hits: Optional[Set[str]] = None) -> bool:
         """
         Pre-validate common medical patterns to reduce API calls.
         
         Returns True if the question is very likely medical, allowing it to skip LLM validation.
+        `question_lower` is the already-lowercased question; `hits` can pass in its keyword
+        groups if they were already matched.
         """
-        question_lower = question.lower()
-        
-        # Medical keywords that indicate high likelihood of medical relevance
-        medical_keywords = [
-            'symptom', 'symptoms', 'pain', 'ache', 'hurt', 'surgery', 'surgical', 'operation',
-            'doctor', 'physician', 'hospital', 'clinic', 'treatment', 'medicine', 'medication',
-            'diagnosis', 'diagnose', 'disease', 'condition', 'illness', 'sick', 'health',
-            'infection', 'fever', 'headache', 'nausea', 'vomiting', 'bleeding', 'swelling',
-            'recovery', 'healing', 'wound', 'injury', 'fracture', 'broken', 'sprain',
-            'cancer', 'tumor', 'cyst', 'rash', 'allergic', 'allergy', 'chest pain',
-            'abdomen', 'stomach', 'liver', 'kidney', 'heart', 'lung', 'brain', 'spine',
-            'blood', 'pressure', 'diabetic', 'diabetes', 'hypertension', 'medication',
-            'prescription', 'dosage', 'side effect', 'complication', 'emergency',
-            'urgent', 'acute', 'chronic', 'patient', 'medical history'
-        ]
-        
-        # Temporal medical contexts that should be accepted
-        temporal_medical = [
-            'days ago', 'weeks ago', 'months ago', 'years ago', 'yesterday', 'last week',
-            'last month', 'since', 'after', 'before', 'during', 'following', 'prior to',
-            'recently', 'lately', 'ongoing', 'persistent', 'recurring', 'intermittent'
-        ]
+        if hits is None:
+            hits = _QUESTION_MATCHER.hits(question_lower)
         
         # Check for medical keywords
-        for keyword in medical_keywords:
-            if keyword in question_lower:
-                return True
+        if "medical" in hits:
+            return True
         
         # Check for temporal medical contexts combined with any health indicators
-        health_indicators = ['feel', 'feeling', 'experience', 'experiencing', 'having', 'been', 'was', 'got', 'developed']
+        if "temporal" in hits and "health_indicator" in hits:
+            return True
         
-        for temporal in temporal_medical:
-            if temporal in question_lower:
-                for indicator in health_indicators:
-                    if indicator in question_lower:
-                        return True
-        
-        # Check if there's relevant medical context in history
-        if history_text:
-            history_lower = history_text.lower()
-            for keyword in medical_keywords[:15]:  # Check first 15 most common ones
-                if keyword in history_lower and len(question.split()) <= 10:  # Short follow-up questions
-                    return True
+        # Check if there's relevant medical context in history for short follow-up questions
+        if history_text and len(question_lower.split()) <= 10:
+            if _HISTORY_MATCHER.matches_any(history_text.lower()):
+                return True
         
         return False
@@ -3,11 +3,20 @@ Flask AI Service for Meddollina
 Wraps the SurgicalLLM and exposes REST API endpoints
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
+import hmac
+import logging
+import threading
 from dotenv import load_dotenv
-import traceback
+
+try:
+    from flask_compress import Compress
+    COMPRESS_AVAILABLE = True
+except ImportError:
+    Compress = None
+    COMPRESS_AVAILABLE = False
 
 # Load environment variables
 load_dotenv()
@@ -15,8 +24,33 @@ load_dotenv()
 # Import LLM components
 from LLM.main import SurgicalLLM
 from LLM.config import Config
+from LLM.exact_cache import ExactCache
+from LLM.json_provider import OrjsonProvider
+from LLM.error_log import SampledExceptionLogger
+from LLM.payloads import ChatResponse, PayloadError, decode_chat_request, encode
+from LLM.validation import INVALID_JSON_MESSAGE
+
+# Pipeline debug output from the LLM package goes through logging; LOG_LEVEL=DEBUG shows it
+logging.basicConfig(level=Config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+# Full tracebacks for the first few failures of each kind per minute, one-line errors during storms
+error_log = SampledExceptionLogger(log)
 
-app = Flask(__name__)
+# JSON API only: no static file route to match against
+app = Flask(__name__, static_folder=None)
+# orjson for jsonify and request.get_json (large OCR payloads); stdlib json if it isn't installed
+app.json = OrjsonProvider(app)
+
+# Compress large JSON responses (answers with sources, summaries) in the best encoding the
+# client accepts; SSE streams stay uncompressed so each event is flushed as it's produced
+if COMPRESS_AVAILABLE:
+    app.config.update(
+        COMPRESS_ALGORITHM=['zstd', 'br', 'gzip'],
+        COMPRESS_ZSTD_LEVEL=3,
+        COMPRESS_MIN_SIZE=4096,
+        COMPRESS_STREAMS=False
+    )
+    Compress(app)
 
 # Configure CORS - allow requests from Express backend
 CORS(app, resources={
@@ -27,37 +61,108 @@ CORS(app, resources={
     }
 })
 
+# Responses to byte-identical requests (resends, retries); near-duplicate questions are
+# handled by SurgicalLLM's semantic response cache
+chat_cache = ExactCache(Config.EXACT_CACHE_SIZE, Config.EXACT_CACHE_TTL)
+summary_cache = ExactCache(Config.EXACT_CACHE_SIZE, Config.EXACT_CACHE_TTL)
+# Suggestions for the same recent conversation and last message
+suggestions_cache = ExactCache(Config.EXACT_CACHE_SIZE, Config.EXACT_CACHE_TTL)
+
 # Global LLM instance (lazy initialization)
 surgical_llm = None
 llm_init_error = None
+# Concurrent first requests must not each construct (and load) their own SurgicalLLM
+_llm_lock = threading.Lock()
 
 def get_llm():
-    """Get or initialize the SurgicalLLM instance"""
+    """
+    Get or initialize the SurgicalLLM instance.
+
+    Its models keep loading in the background after this returns; SurgicalLLM
+    methods wait for them on first use.
+    """
     global surgical_llm, llm_init_error
     
     if surgical_llm is not None:
         return surgical_llm
     
-    if llm_init_error is not None:
-        raise llm_init_error
-    
-    try:
-        print("Initializing SurgicalLLM...")
-        surgical_llm = SurgicalLLM(Config())
-        print("SurgicalLLM initialized successfully")
-        return surgical_llm
-    except Exception as e:
-        llm_init_error = e
-        print(f"Failed to initialize LLM: {e}")
-        raise e
+    with _llm_lock:
+        if surgical_llm is not None:
+            return surgical_llm
+        
+        if llm_init_error is not None:
+            raise llm_init_error
+        
+        try:
+            print("Initializing SurgicalLLM...")
+            surgical_llm = SurgicalLLM(Config())
+            print("SurgicalLLM initialized successfully")
+            return surgical_llm
+        except Exception as e:
+            llm_init_error = e
+            print(f"Failed to initialize LLM: {e}")
+            raise e
+
+def chat_context(system_prompt, ocr_content):
+    """
+    System message and uploaded document to pass to QA.
+
+    A custom system prompt takes precedence over OCR content. Either one is placed in
+    front of the chat history, where QA reads it without copying the history; long
+    OCR content is cut down to the parts relevant to the message.
+    """
+    if system_prompt:
+        log.debug("Using custom system prompt (%d chars)", len(system_prompt))
+        return {
+            'role': 'system',
+            'content': system_prompt
+        }, None
+    if ocr_content:
+        log.debug("Including OCR content in context (%d chars)", len(ocr_content))
+    return None, ocr_content
+
+def chat_response_data(answer, sources, heading, context_data):
+    """Response payload for a QA result"""
+    return ChatResponse(
+        response=answer,
+        heading=heading,
+        sources=sources,
+        tokens_used=context_data.get('tokens_used', 0),
+        processing_time=context_data.get('processing_time', 0)
+    )
+
+# QA results that report a failure (inference or validator errors) rather than an answer
+UNCACHEABLE_INTENTS = frozenset({'error', 'validation_error'})
+
+def is_cacheable_answer(answer, context_data):
+    """Whether a QA result is a real answer, safe to replay for the cache's TTL"""
+    return context_data.get('intent') not in UNCACHEABLE_INTENTS and answer != INVALID_JSON_MESSAGE
+
+def chat_json_response(data):
+    """Successful chat response, encoded straight from the payload struct"""
+    return Response(encode({'success': True, 'data': data}), mimetype='application/json')
+
+def invalid_chat_request(error):
+    """400 response for a chat body that doesn't decode into a ChatRequest"""
+    return jsonify({
+        'success': False,
+        'message': 'Message is required',
+        'error': str(error)
+    }), 400
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {encode(data).decode()}\n\n"
+
+# API Key validation middleware; the expected key is read from the environment once, at import
+EXPECTED_API_KEY = os.getenv('AI_API_KEY', 'default-dev-key').encode()
 
-# API Key validation middleware
 def validate_api_key():
     """Validate API key from request headers"""
-    api_key = request.headers.get('X-API-Key')
-    expected_key = os.getenv('AI_API_KEY', 'default-dev-key')
+    api_key = request.headers.get('X-API-Key', '')
     
-    if api_key != expected_key:
+    # Constant-time comparison, so response timing doesn't reveal how much of the key matched
+    if not hmac.compare_digest(api_key.encode(), EXPECTED_API_KEY):
         return jsonify({
             'success': False,
             'message': 'Invalid or missing API key'
@@ -65,18 +170,21 @@ def validate_api_key():
     
     return None
 
+# Endpoints that require the API key. The health check is registered on the app itself,
+# so requests are matched once by the router instead of re-checking the path in a hook.
+api = Blueprint('api', __name__, url_prefix='/api')
+
+@api.before_request
+def require_api_key():
+    """Run before each API request"""
+    return validate_api_key()
+
 @app.before_request
-def before_request():
-    """Run before each request"""
-    # Skip API key validation for health check
-    if request.path == '/api/health':
-        return None
-    
-    # Validate API key for all other endpoints
-    if request.path.startswith('/api/'):
-        error_response = validate_api_key()
-        if error_response:
-            return error_response
+def require_api_key_for_unmatched_api_paths():
+    """Reject unknown /api/ paths (404/405) without a key, so they don't reveal which routes exist"""
+    if request.url_rule is None and request.path.startswith('/api/'):
+        return validate_api_key()
+    return None
 
 @app.route('/')
 def index():
@@ -105,7 +213,7 @@ def health_check():
             'error': str(e)
         }), 503
 
-@app.route('/api/chat', methods=['POST'])
+@api.route('/chat', methods=['POST'])
 def chat():
     """
     Process chat message with AI
@@ -118,94 +226,115 @@ def chat():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Message is required'
-            }), 400
+        # Decoded straight from the raw body into a typed struct (see LLM/payloads.py)
+        try:
+            chat_request = decode_chat_request(request.get_data())
+        except PayloadError as e:
+            return invalid_chat_request(e)
         
-        message = data['message']
-        conversation_id = data.get('conversation_id')
-        history = data.get('history', [])
-        ocr_content = data.get('ocr_content')
-        attachments = data.get('attachments')
-        system_prompt = data.get('system_prompt')
-        context = data.get('context')
+        message = chat_request.message
+        history = chat_request.history or []
+        ocr_content = chat_request.ocr_content
+        system_prompt = chat_request.system_prompt
+        attachments = chat_request.attachments
         
-        # DEBUG: Log what we received
-        print(f"[FLASK] Received request:")
-        print(f"[FLASK] - Message: {message[:100]}...")
-        print(f"[FLASK] - Conversation ID: {conversation_id}")
-        print(f"[FLASK] - History items: {len(history) if history else 0}")
-        print(f"[FLASK] - OCR content: {'YES (' + str(len(ocr_content)) + ' chars)' if ocr_content else 'NO'}")
-        print(f"[FLASK] - Attachments: {len(attachments) if attachments else 0}")
+        # Request summary; arguments are only formatted when LOG_LEVEL=DEBUG
+        log.debug(
+            "Chat request: conversation=%s message_chars=%d history_items=%d ocr_chars=%d attachments=%d",
+            chat_request.conversation_id, len(message), len(history),
+            len(ocr_content) if ocr_content else 0, len(attachments) if attachments else 0
+        )
         
-        if ocr_content:
-            print(f"[FLASK] OCR Content Preview: {ocr_content[:300]}...")
-            print(f"[FLASK] OCR Content Full Length: {len(ocr_content)}")
-            print(f"[FLASK] OCR Content Type: {type(ocr_content)}")
-            if len(ocr_content) > 1000:
-                print(f"[FLASK] ✅ OCR content has substantial data")
-            else:
-                print(f"[FLASK] ⚠️ OCR content seems short")
+        cache_key = ExactCache.key(message, history, system_prompt, ocr_content)
+        cached = chat_cache.get(cache_key)
+        if cached is not None:
+            log.debug("Serving cached response")
+            return chat_json_response(cached.as_cached())
         
         # Get LLM instance
         llm = get_llm()
         
         # Process the query using QA method
-        print(f"[FLASK] Processing query: {message[:100]}...")
-        
-        # If OCR content is present, add it to the history context with consistent formatting
-        enhanced_history = history
-        
-        # Add system prompt if provided
-        if system_prompt:
-            print(f"[FLASK] ✅ Using custom system prompt ({len(system_prompt)} chars)")
-            system_message = {
-                'role': 'system',
-                'content': system_prompt
-            }
-            enhanced_history = [system_message] + (history if history else [])
-        elif ocr_content:
-            print(f"[FLASK] ✅ Including OCR content in context ({len(ocr_content)} chars)")
-            # Add OCR content as a system message with consistent format instruction
-            ocr_context_message = {
-                'role': 'system',
-                'content': f'Additional context from user\'s documents:\n\n{ocr_content}\n\nIMPORTANT: Respond in the same format as you would for a normal medical consultation. Use this information naturally but maintain your standard response structure.'
-            }
-            # Insert at the beginning of history so it's always available as context
-            enhanced_history = [ocr_context_message] + (history if history else [])
-        else:
-            print(f"[FLASK] ⚠️  No OCR content or system prompt - processing without document context")
+        system_message, document = chat_context(system_prompt, ocr_content)
+        answer, sources, heading, context_data = llm.QA(
+            message, history, system_prefix=system_message, document=document
+        )
         
-        if ocr_content and not system_prompt:
-            print(f"[FLASK] Enhanced history now has {len(enhanced_history)} items")
+        response_data = chat_response_data(answer, sources, heading, context_data)
+        if is_cacheable_answer(answer, context_data):
+            chat_cache.set(cache_key, response_data)
         
-        answer, sources, heading, context_data = llm.QA(message, enhanced_history)
+        return chat_json_response(response_data)
         
+    except Exception as e:
+        error_log.exception("Chat error", e)
         return jsonify({
-            'success': True,
-            'data': {
-                'response': answer,
-                'heading': heading,
-                'sources': sources,
-                'tokens_used': context_data.get('tokens_used', 0),
-                'processing_time': context_data.get('processing_time', 0)
-            }
-        })
+            'success': False,
+            'message': 'Failed to process chat message',
+            'error': str(e)
+        }), 500
+
+@api.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Process chat message with AI, streaming the answer as Server-Sent Events
+    
+    Takes the same JSON body as /api/chat. Emits `token` events ({"delta": "..."})
+    as the answer is generated, then one `done` event carrying the same data as
+    /api/chat (the final answer is cleaned, so it can differ from the joined
+    deltas), or an `error` event.
+    """
+    try:
+        try:
+            chat_request = decode_chat_request(request.get_data())
+        except PayloadError as e:
+            return invalid_chat_request(e)
         
+        message = chat_request.message
+        history = chat_request.history or []
+        ocr_content = chat_request.ocr_content
+        system_prompt = chat_request.system_prompt
+        
+        cache_key = ExactCache.key(message, history, system_prompt, ocr_content)
+        cached = chat_cache.get(cache_key)
+        llm = get_llm() if cached is None else None
     except Exception as e:
-        print(f"Chat error: {e}")
-        traceback.print_exc()
+        error_log.exception("Chat stream error", e)
         return jsonify({
             'success': False,
             'message': 'Failed to process chat message',
             'error': str(e)
         }), 500
+    
+    def events():
+        if cached is not None:
+            yield sse_event('done', cached.as_cached())
+            return
+        try:
+            system_message, document = chat_context(system_prompt, ocr_content)
+            for kind, payload in llm.QA_stream(message, history, system_prefix=system_message, document=document):
+                if kind == 'token':
+                    yield sse_event('token', {'delta': payload})
+                    continue
+                answer, sources, heading, context_data = payload
+                response_data = chat_response_data(answer, sources, heading, context_data)
+                if is_cacheable_answer(answer, context_data):
+                    chat_cache.set(cache_key, response_data)
+                yield sse_event('done', response_data)
+        except Exception as e:
+            error_log.exception("Chat stream error", e)
+            yield sse_event('error', {
+                'message': 'Failed to process chat message',
+                'error': str(e)
+            })
+    
+    # No buffering by proxies (nginx) so each event reaches the client as it's produced
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-@app.route('/api/summarize', methods=['POST'])
+@api.route('/summarize', methods=['POST'])
 def summarize():
     """
     Summarize conversation or text
@@ -228,7 +357,22 @@ def summarize():
         content = data['content']
         summary_type = data.get('type', 'medical')
         
-        # Get LLM instance
+        # The prompt only depends on the content; the type is echoed back
+        cache_key = ExactCache.key(content)
+        summary = summary_cache.get(cache_key)
+        if summary is not None:
+            return jsonify({
+                'success': True,
+                'data': {
+                    'summary': summary,
+                    'type': summary_type,
+                    'original_length': len(content),
+                    'summary_length': len(summary),
+                    'cached': True
+                }
+            })
+        
+        # Get LLM instance; the inference client exists once the background load has finished
         llm = get_llm()
         llm._ensure_initialized()
         
@@ -256,6 +400,7 @@ Provide a clear, concise medical summary:"""
         )
         
         summary = response.choices[0].message.content.strip()
+        summary_cache.set(cache_key, summary)
         
         return jsonify({
             'success': True,
@@ -268,15 +413,14 @@ Provide a clear, concise medical summary:"""
         })
         
     except Exception as e:
-        print(f"Summarization error: {e}")
-        traceback.print_exc()
+        error_log.exception("Summarization error", e)
         return jsonify({
             'success': False,
             'message': 'Failed to generate summary',
             'error': str(e)
         }), 500
 
-@app.route('/api/suggestions', methods=['POST'])
+@api.route('/suggestions', methods=['POST'])
 def get_suggestions():
     """
     Get smart suggestions based on context
@@ -290,17 +434,18 @@ def get_suggestions():
     try:
         data = request.get_json()
         
-        # Get LLM instance
-        llm = get_llm()
-        llm._ensure_initialized()
-        
         context = data.get('context', '')
         last_message = data.get('last_message', '')
         
-        # Import suggestions module
-        from LLM.suggestions import get_smart_suggestions
-        
-        suggestions = get_smart_suggestions(context, last_message)
+        cache_key = ExactCache.key(context, last_message)
+        suggestions = suggestions_cache.get(cache_key)
+        if suggestions is None:
+            # Import suggestions module
+            from LLM.suggestions import get_smart_suggestions
+            
+            suggestions = get_smart_suggestions(context, last_message)
+            if suggestions:
+                suggestions_cache.set(cache_key, suggestions)
         
         return jsonify({
             'success': True,
@@ -317,6 +462,8 @@ def get_suggestions():
             'error': str(e)
         }), 500
 
+app.register_blueprint(api)
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -344,7 +491,14 @@ if __name__ == '__main__':
     print(f"Debug: {debug}")
     print(f"Model: {Config.MODEL_NAME}")
     print(f"{'='*60}\n")
+
+    # Create the LLM now so its models load in the background while the server starts
+    try:
+        get_llm()
+    except Exception:
+        pass  # Already reported by get_llm; requests return the error
     
+    # Development server; in production run `gunicorn -c gunicorn_conf.py app:app`
     app.run(
         host='0.0.0.0',
         port=port,
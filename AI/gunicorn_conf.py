@@ -0,0 +1,80 @@
+"""
+Gunicorn configuration for the Meddollina AI Service
+
+Usage (from the AI directory):
+    gunicorn -c gunicorn_conf.py app:app
+
+    # Greenlet workers: thousands of in-flight inference calls per worker
+    GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn_conf.py app:app
+
+The app module (Flask, torch, transformers, LangChain) is imported once in the
+master and shared copy-on-write by the workers, as are the tokenizer and spaCy
+pipeline (see `when_ready`). Each worker builds its own SurgicalLLM right after
+the fork, so models load before the first request rather than during it.
+"""
+
+import gc
+import multiprocessing
+import os
+
+# Requests mostly wait on the remote inference API, so threads (not processes) carry the concurrency.
+# gevent holds far more requests in flight, but CPU-bound steps (embedding, tokenization, metrics)
+# block every greenlet in the worker while they run.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # Patch before preload_app imports the app, so requests/urllib3/ssl and the
+    # LLM package's threads and queues are created cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+
+# Import the app in the master so workers inherit the loaded modules
+preload_app = True
+
+workers = int(os.getenv("GUNICORN_WORKERS", 2 * multiprocessing.cpu_count() + 1))
+# gthread: threads per worker; gevent: concurrent greenlets per worker
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 2500))
+
+# Recycle workers to bound slow leaks; jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 500))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Chain-of-thought plus generation can take well over gunicorn's 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+
+
+def when_ready(server):
+    """
+    Load fork-safe shared data in the master, after the app is preloaded and before any fork.
+
+    The tokenizer and spaCy pipeline are plain data (no threads, sessions or open
+    files), so every worker can share the master's copy instead of parsing its own.
+    The embedding and metrics models start ONNX/PyTorch thread pools and stay per
+    worker. gc.freeze() keeps the workers' garbage collector from writing to, and
+    so un-sharing, the pages of everything loaded so far.
+    """
+    from LLM.config import Config
+    from LLM.metrics import _get_spacy
+    from LLM.utils import _load_tokenizer
+
+    _load_tokenizer(Config.MODEL_NAME)
+    _get_spacy()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Create the worker's SurgicalLLM as soon as it is forked.
+
+    SurgicalLLM starts threads and opens the Chroma SQLite database, neither of
+    which survives a fork, so it is built here rather than in the master.
+    """
+    from app import get_llm
+
+    try:
+        get_llm()
+    except Exception as e:
+        server.log.error(f"Worker {worker.pid}: failed to initialize LLM: {e}")
@@ -1,32 +1,81 @@
 """
 Independent Summarization Service
 This service provides medical text summarization without interfering with the main Meddollina AI
+
+Runs on Quart (async Flask) with a pooled async chat client, so a request waiting on
+the inference API holds a coroutine rather than a thread, and requests share warm
+(HTTP/2 when available) connections. Production:
+    hypercorn summarizer_service:app --bind 0.0.0.0:5002 --worker-class asyncio
 """
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, request, jsonify
+from quart_cors import cors
 import os
+import hmac
+import re
+import logging
 from dotenv import load_dotenv
-import traceback
-from huggingface_hub import InferenceClient
+
+from LLM.async_chat_client import AsyncChatClient, DEFAULT_BASE_URL
+from LLM.error_log import SampledExceptionLogger
+from LLM.exact_cache import ExactCache
+from LLM.json_provider import OrjsonProvider
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+# Tracebacks are rate-limited per exception type, so inference outages don't flood the log
+error_log = SampledExceptionLogger(log)
+
+app = Quart(__name__)
+# orjson for jsonify and request.get_json; stdlib json if it isn't installed
+app.json = OrjsonProvider(app)
 
 # Configure CORS
-CORS(app, resources={
-    r"/api/*": {
-        "origins": ["http://localhost:5000", "http://localhost:8080"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
+app = cors(
+    app,
+    allow_origin=["http://localhost:5000", "http://localhost:8080"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"]
+)
 
 # Global LLM client
 summarizer_client = None
 
+# Words of a summary, scanned once when truncating
+_WORD_RE = re.compile(r'\S+')
+
+# Prompt pieces that don't change between requests (the client doesn't mutate messages)
+SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a medical summarizer that creates brief bullet-point summaries. Always condense to 10-20% of original length."
+}
+
+SUMMARY_PROMPT_TEMPLATE = """MEDICAL TEXT SUMMARIZATION
+
+You MUST create a concise medical summary. This is a SUMMARIZATION task - condense the information, do not repeat it.
+
+Original Text ({chars} characters, {words} words):
+{content}
+
+CRITICAL REQUIREMENTS:
+• Summary MUST be under {max_words} words
+• Aim for 10-20% of original length
+• Use bullet points for key information
+• Extract ONLY: symptoms, diagnosis, treatment, medications, prognosis
+• NO conversational filler or verbose explanations
+• Focus on actionable medical insights
+
+CONCISE SUMMARY:"""
+
+# Summaries of byte-identical requests, keyed on the content and word limit
+summary_cache = ExactCache(
+    int(os.getenv('EXACT_CACHE_SIZE', 1024)),
+    int(os.getenv('EXACT_CACHE_TTL', 3600))
+)
+
 def get_summarizer_client():
     """Get or initialize the summarizer client"""
     global summarizer_client
@@ -36,9 +85,10 @@ def get_summarizer_client():
     
     try:
         print("Initializing Summarizer LLM client...")
-        summarizer_client = InferenceClient(
+        summarizer_client = AsyncChatClient(
             model="meta-llama/Llama-3.3-70B-Instruct",
             token=os.getenv('HF_TOKEN'),
+            base_url=os.getenv('SUMMARIZER_BASE_URL', DEFAULT_BASE_URL),
             timeout=60
         )
         print("Summarizer client initialized successfully")
@@ -47,13 +97,21 @@ def get_summarizer_client():
         print(f"Failed to initialize summarizer client: {e}")
         raise e
 
-# API Key validation middleware
+@app.after_serving
+async def close_summarizer_client():
+    """Close the client's pooled connections on shutdown"""
+    if summarizer_client is not None:
+        await summarizer_client.aclose()
+
+# API Key validation middleware; the expected key is read from the environment once, at import
+EXPECTED_API_KEY = os.getenv('AI_API_KEY', 'meddollina-internal-api-key-2024').encode()
+
 def validate_api_key():
     """Validate API key from request headers"""
-    api_key = request.headers.get('X-API-Key')
-    expected_key = os.getenv('AI_API_KEY', 'meddollina-internal-api-key-2024')
+    api_key = request.headers.get('X-API-Key', '')
     
-    if api_key != expected_key:
+    # Constant-time comparison, so response timing doesn't reveal how much of the key matched
+    if not hmac.compare_digest(api_key.encode(), EXPECTED_API_KEY):
         return jsonify({
             'success': False,
             'message': 'Invalid or missing API key'
@@ -62,7 +120,7 @@ def validate_api_key():
     return None
 
 @app.before_request
-def before_request():
+async def before_request():
     """Run before each request"""
     # Skip API key validation for health check
     if request.path == '/api/health':
@@ -75,7 +133,7 @@ def before_request():
             return error_response
 
 @app.route('/')
-def index():
+async def index():
     """Root endpoint"""
     return jsonify({
         'service': 'Meddollina Summarization Service',
@@ -84,7 +142,7 @@ def index():
     })
 
 @app.route('/api/health', methods=['GET'])
-def health_check():
+async def health_check():
     """Health check endpoint"""
     try:
         client = get_summarizer_client()
@@ -101,8 +159,45 @@ def health_check():
             'error': str(e)
         }), 503
 
+def _truncate_to_words(summary, max_words):
+    """Cut the summary after the last whole sentence (split on '. ') that fits in max_words words"""
+    # One pass over the words: remember where the last complete sentence ended and
+    # stop at the first word past the limit, instead of splitting sentence by sentence
+    word_count = 0
+    end = 0
+    for word in _WORD_RE.finditer(summary):
+        word_count += 1
+        if word_count > max_words:
+            break
+        # A word ending in '.' followed by a space closes a sentence
+        word_end = word.end()
+        if summary[word_end - 1] == '.' and summary[word_end:word_end + 1] == ' ':
+            end = word_end - 1
+    else:
+        return summary
+    summary = summary[:end]
+    if summary and not summary.endswith('.'):
+        summary += '.'
+    return summary
+
+def _summary_data(summary, summary_type, content, content_words, cached=False):
+    """Build the response payload for a summary"""
+    summary_words = len(summary.split())
+    data = {
+        'summary': summary,
+        'type': summary_type,
+        'original_length': len(content),
+        'original_words': content_words,
+        'summary_length': len(summary),
+        'summary_words': summary_words,
+        'compression_ratio': f"{(summary_words / content_words * 100):.1f}%"
+    }
+    if cached:
+        data['cached'] = True
+    return data
+
 @app.route('/api/summarize', methods=['POST'])
-def summarize_text():
+async def summarize_text():
     """
     Summarize medical text with strict constraints
     
@@ -114,7 +209,7 @@ def summarize_text():
     }
     """
     try:
-        data = request.get_json()
+        data = await request.get_json()
         
         if not data or 'content' not in data:
             return jsonify({
@@ -126,79 +221,54 @@ def summarize_text():
         summary_type = data.get('type', 'medical')
         max_words = data.get('max_length', 250)
         
-        # Get LLM client
-        client = get_summarizer_client()
-        
         # Calculate content statistics
         content_words = len(content.split())
         content_chars = len(content)
         
+        cache_key = ExactCache.key(content, max_words)
+        summary = summary_cache.get(cache_key)
+        if summary is not None:
+            return jsonify({
+                'success': True,
+                'data': _summary_data(summary, summary_type, content, content_words, cached=True)
+            })
+        
+        # Get LLM client
+        client = get_summarizer_client()
+        
         # Build strict summarization prompt
-        summary_prompt = f"""MEDICAL TEXT SUMMARIZATION
-
-You MUST create a concise medical summary. This is a SUMMARIZATION task - condense the information, do not repeat it.
-
-Original Text ({content_chars} characters, {content_words} words):
-{content}
-
-CRITICAL REQUIREMENTS:
-• Summary MUST be under {max_words} words
-• Aim for 10-20% of original length
-• Use bullet points for key information
-• Extract ONLY: symptoms, diagnosis, treatment, medications, prognosis
-• NO conversational filler or verbose explanations
-• Focus on actionable medical insights
-
-CONCISE SUMMARY:"""
+        summary_prompt = SUMMARY_PROMPT_TEMPLATE.format_map({
+            'chars': content_chars,
+            'words': content_words,
+            'content': content,
+            'max_words': max_words
+        })
 
         messages = [
-            {"role": "system", "content": "You are a medical summarizer that creates brief bullet-point summaries. Always condense to 10-20% of original length."},
+            SUMMARY_SYSTEM_MESSAGE,
             {"role": "user", "content": summary_prompt}
         ]
         
         # Generate summary with strict limits
-        response = client.chat_completion(
+        summary = await client.chat_completion(
             messages=messages,
             max_tokens=300,  # Strict token limit
             temperature=0.2  # Lower temperature for consistency
         )
-        
-        summary = response.choices[0].message.content.strip()
+        summary = summary.strip()
         
         # Post-process to ensure conciseness
-        summary_words = len(summary.split())
-        if summary_words > max_words:
-            # Truncate if still too long
-            sentences = summary.split('. ')
-            truncated = []
-            word_count = 0
-            for sentence in sentences:
-                sentence_words = len(sentence.split())
-                if word_count + sentence_words <= max_words:
-                    truncated.append(sentence)
-                    word_count += sentence_words
-                else:
-                    break
-            summary = '. '.join(truncated)
-            if summary and not summary.endswith('.'):
-                summary += '.'
+        summary = _truncate_to_words(summary, max_words)
+        
+        summary_cache.set(cache_key, summary)
         
         return jsonify({
             'success': True,
-            'data': {
-                'summary': summary,
-                'type': summary_type,
-                'original_length': len(content),
-                'original_words': content_words,
-                'summary_length': len(summary),
-                'summary_words': len(summary.split()),
-                'compression_ratio': f"{(len(summary.split()) / content_words * 100):.1f}%"
-            }
+            'data': _summary_data(summary, summary_type, content, content_words)
         })
         
     except Exception as e:
-        print(f"Summarization error: {e}")
-        traceback.print_exc()
+        error_log.exception("Summarization error", e)
         return jsonify({
             'success': False,
             'message': 'Failed to generate summary',
@@ -206,7 +276,7 @@ CONCISE SUMMARY:"""
         }), 500
 
 @app.errorhandler(404)
-def not_found(error):
+async def not_found(error):
     """Handle 404 errors"""
     return jsonify({
         'success': False,
@@ -214,7 +284,7 @@ def not_found(error):
     }), 404
 
 @app.errorhandler(500)
-def internal_error(error):
+async def internal_error(error):
     """Handle 500 errors"""
     return jsonify({
         'success': False,
@@ -233,9 +303,9 @@ if __name__ == '__main__':
     print(f"Model: meta-llama/Llama-3.3-70B-Instruct")
     print(f"{'='*60}\n")
     
+    # Development server; in production run under hypercorn (see module docstring)
     app.run(
         host='0.0.0.0',
         port=port,
-        debug=debug,
-        threaded=True
+        debug=debug
     )